@@ -159,6 +159,82 @@ BOT_TOKEN = env.str('BOT_TOKEN')
 
 ADMINS_LIST = env.list('ADMINS_LIST')
 
+REDIS_URL = env.str('REDIS_URL', 'redis://localhost:6379/0')
+
+# Хранилище FSM бота: "redis" (общее для всех воркеров) или "memory" (для тестов)
+FSM_STORAGE = env.str('FSM_STORAGE', 'redis')
+FSM_STATE_TTL = env.int('FSM_STATE_TTL', 60 * 60 * 24 * 3)
+FSM_DATA_TTL = env.int('FSM_DATA_TTL', 60 * 60 * 24 * 3)
+
+# Webhook-режим бота: python manage.py runbot --webhook
+WEBHOOK_BASE_URL = env.str('WEBHOOK_BASE_URL', '')
+WEBHOOK_PATH = env.str('WEBHOOK_PATH', '/bot/webhook')
+WEBHOOK_SECRET = env.str('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = env.str('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = env.int('WEBHOOK_PORT', 8081)
+BOT_WORKERS = env.int('BOT_WORKERS', 4)
+BOT_QUEUE_SIZE = env.int('BOT_QUEUE_SIZE', 1000)
+
+# Метрики бота в формате Prometheus: GET http://<METRICS_HOST>:<METRICS_PORT>/metrics.
+# По умолчанию выключены (0); эндпоинт без авторизации, поэтому слушает только localhost.
+# У каждого процесса бота на одном хосте должен быть свой порт
+METRICS_HOST = env.str('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = env.int('METRICS_PORT', 0)
+
+# Ограничение частоты сообщений (token bucket): "redis" — общие лимиты для всех воркеров, "memory" — в процессе
+THROTTLE_STORAGE = env.str('THROTTLE_STORAGE', FSM_STORAGE)
+THROTTLE_RATE_LIMIT = env.float('THROTTLE_RATE_LIMIT', 1.0)
+THROTTLE_BURST = env.int('THROTTLE_BURST', 5)
+THROTTLE_WARNING_COOLDOWN = env.float('THROTTLE_WARNING_COOLDOWN', 5.0)
+THROTTLE_CACHE_SIZE = env.int('THROTTLE_CACHE_SIZE', 10000)
+
+# Celery: фоновые задачи (архивирование анкет). Для тестов: CELERY_BROKER_URL=memory:// и CELERY_TASK_ALWAYS_EAGER=True
+CELERY_BROKER_URL = env.str('CELERY_BROKER_URL', REDIS_URL)
+CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', False)
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TIMEZONE = TIME_ZONE
+
+# Очередь уведомлений пациентам (python manage.py sendnotifications). Telegram допускает ~30 сообщений в секунду
+NOTIFICATION_RATE_LIMIT = env.int('NOTIFICATION_RATE_LIMIT', 30)
+NOTIFICATION_BATCH_SIZE = env.int('NOTIFICATION_BATCH_SIZE', 30)
+NOTIFICATION_MAX_ATTEMPTS = env.int('NOTIFICATION_MAX_ATTEMPTS', 5)
+NOTIFICATION_POOL_SIZE = env.int('NOTIFICATION_POOL_SIZE', 4)
+NOTIFICATION_REQUEST_TIMEOUT = env.float('NOTIFICATION_REQUEST_TIMEOUT', 10.0)
+NOTIFICATION_POLL_INTERVAL = env.float('NOTIFICATION_POLL_INTERVAL', 1.0)
+
+# Общий кеш веб-сервера и бота (статистика панели управления)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': env.str('CACHE_URL', REDIS_URL),
+        'KEY_PREFIX': 'sabo',
+    }
+}
+PATIENT_STATS_CACHE_TTL = env.int('PATIENT_STATS_CACHE_TTL', 30)
+
+# Сколько новых пользователей бот регистрирует за день
+DAILY_REGISTRATION_LIMIT = env.int('DAILY_REGISTRATION_LIMIT', 20)
+
+# Логи бота (robot/utils/misc/logging.py): пишутся фоновым потоком, файлы ротируются в полночь
+LOG_DIR = env.str('LOG_DIR', 'logs')
+LOG_BACKUP_COUNT = env.int('LOG_BACKUP_COUNT', 30)
+# При переполнении очереди записи отбрасываются, а не задерживают обработку апдейтов
+LOG_QUEUE_SIZE = env.int('LOG_QUEUE_SIZE', 10000)
+# Переходы состояний анкеты (StateTransition) сохраняются пачками: по размеру или по возрасту пачки в секундах
+STATE_TRANSITION_BATCH_SIZE = env.int('STATE_TRANSITION_BATCH_SIZE', 100)
+STATE_TRANSITION_FLUSH_INTERVAL = env.float('STATE_TRANSITION_FLUSH_INTERVAL', 5.0)
+
+# Куда сохраняются анкеты: 'local' (папка questionnaire_storage) или 'drive' (Google Drive)
+QUESTIONNAIRE_STORAGE = env.str('QUESTIONNAIRE_STORAGE', 'local')
+
+# Бюджет времени импорта бота для python manage.py importtime, мс
+IMPORT_TIME_BUDGET_MS = env.int('IMPORT_TIME_BUDGET_MS', 3000)
+
 from drf_yasg import openapi
 
 SWAGGER_SETTINGS = {
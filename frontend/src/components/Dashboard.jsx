@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { Card, CardContent } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
@@ -38,17 +38,17 @@ const StatusBadge = ({ status }) => {
   return <Badge className={s.className}>{s.text}</Badge>;
 };
 
-const ActionButtons = ({ patient, onApprove, onReject, userRole }) => {
-  const isDoctor = userRole === "doctor";
-  const isAccountant = userRole === "accountant";
-
-  const alreadyActed =
-    (isDoctor && (patient.approved_by_doctor || patient.rejected_by_doctor)) ||
-    (isAccountant &&
-      (patient.approved_by_accountant || patient.rejected_by_accountant));
+// Проверяющий еще не принимал решения по анкете
+const canDecide = (patient, userRole) => {
+  if (userRole === "doctor")
+    return !patient.approved_by_doctor && !patient.rejected_by_doctor;
+  if (userRole === "accountant")
+    return !patient.approved_by_accountant && !patient.rejected_by_accountant;
+  return false;
+};
 
-  if (!isDoctor && !isAccountant) return null;
-  if (alreadyActed) return null;
+const ActionButtons = ({ patient, onApprove, onReject, userRole }) => {
+  if (!canDecide(patient, userRole)) return null;
 
   return (
     <div className="flex gap-2">
@@ -193,29 +193,160 @@ const LateIcon = () => (
   </svg>
 );
 
+// Фильтр в интерфейсе -> параметры запроса /api/patients/
+const STATUS_FILTERS = {
+  Все: {},
+  Одобрено: { status: "fully_approved" },
+  Отклонено: { status: "rejected" },
+  Ожидание: { status: "waiting,approved_by_doctor,approved_by_accountant" },
+  "Моя очередь": { queue: "mine" },
+};
+
+const PAGE_SIZE = 50;
+const STATS_POLL_INTERVAL = 30000;
+const CHANGES_POLL_INTERVAL = 10000;
+
 export default function Dashboard() {
   const [statusFilter, setStatusFilter] = useState("Все");
   const [search, setSearch] = useState("");
   const [viewMode, setViewMode] = useState("table");
   const [patients, setPatients] = useState([]);
+  const [selectedIds, setSelectedIds] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loading, setLoading] = useState(false);
   const [userRole, setUserRole] = useState("");
+  // Курсор /api/patients/changes/: после первой загрузки запрашиваются только измененные анкеты
+  const syncCursorRef = useRef(null);
+  const [stats, setStats] = useState({
+    total: 0,
+    approved: 0,
+    rejected: 0,
+    pending: 0,
+    late: 0,
+  });
+
+  const fetchStats = async () => {
+    try {
+      const response = await axiosInstance.get("/api/patients/stats/");
+      setStats(response.data);
+    } catch (error) {
+      console.error("Ошибка при загрузке статистики:", error);
+    }
+  };
 
   useEffect(() => {
     const role = getRoleFromAccessToken();
     if (role) {
       setUserRole(role);
     }
-    const fetchPatients = async () => {
-      try {
-        const response = await axiosInstance.get("/api/patients/");
-        setPatients(response.data);
-      } catch (error) {
-        console.error("Ошибка при загрузке пациентов:", error);
+
+    // Счетчики считает сервер, панель лишь периодически их обновляет
+    fetchStats();
+    const timer = setInterval(fetchStats, STATS_POLL_INTERVAL);
+    return () => clearInterval(timer);
+  }, []);
+
+  const fetchPatients = async (cursor = null) => {
+    setLoading(true);
+    try {
+      if (!cursor) {
+        // Курсор берется до загрузки списка, чтобы не пропустить изменения между запросами
+        const sync = await axiosInstance.get("/api/patients/changes/");
+        syncCursorRef.current = sync.data.next_cursor;
       }
+
+      const params = {
+        ...STATUS_FILTERS[statusFilter],
+        page_size: PAGE_SIZE,
+      };
+      if (search.trim()) params.search = search.trim();
+      if (cursor) params.cursor = cursor;
+
+      const response = await axiosInstance.get("/api/patients/", { params });
+      setPatients((prev) =>
+        cursor ? [...prev, ...response.data.results] : response.data.results
+      );
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error("Ошибка при загрузке пациентов:", error);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const mergeChanges = (changed) => {
+    const showsAll = statusFilter === "Все" && !search.trim();
+    setPatients((prev) => {
+      const changedById = new Map(changed.map((p) => [p.id, p]));
+      const known = new Set(prev.map((p) => p.id));
+      const newest = prev.length ? prev[0].created_at : "";
+      // Новые анкеты добавляются сверху только в общем списке; в фильтрах их покажет перезагрузка
+      const added = showsAll
+        ? changed
+            .filter((p) => !known.has(p.id) && p.created_at >= newest)
+            .sort((a, b) => b.created_at.localeCompare(a.created_at))
+        : [];
+      return [...added, ...prev.map((p) => changedById.get(p.id) || p)];
+    });
+  };
+
+  const fetchChanges = async () => {
+    if (!syncCursorRef.current) return;
+    try {
+      const changed = [];
+      let hasMore = true;
+      while (hasMore) {
+        const response = await axiosInstance.get("/api/patients/changes/", {
+          params: { cursor: syncCursorRef.current },
+        });
+        changed.push(...response.data.results);
+        syncCursorRef.current = response.data.next_cursor;
+        hasMore = response.data.has_more;
+      }
+      if (changed.length) {
+        mergeChanges(changed);
+        fetchStats();
+      }
+    } catch (error) {
+      console.error("Ошибка при загрузке изменений:", error);
+    }
+  };
+
+  // Фильтрация и поиск выполняются на сервере; поиск ждет паузы в наборе
+  useEffect(() => {
+    setSelectedIds([]);
+    const timer = setTimeout(() => fetchPatients(), 300);
+    const changesTimer = setInterval(fetchChanges, CHANGES_POLL_INTERVAL);
+    return () => {
+      clearTimeout(timer);
+      clearInterval(changesTimer);
     };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [statusFilter, search]);
+
+  const toggleSelected = (patientId) => {
+    setSelectedIds((prev) =>
+      prev.includes(patientId)
+        ? prev.filter((id) => id !== patientId)
+        : [...prev, patientId]
+    );
+  };
 
-    fetchPatients();
-  }, []);
+  // Решение по всем выбранным анкетам одним запросом; обновленные строки приходят через changes
+  const handleBulkDecision = async (decision) => {
+    try {
+      await axiosInstance.post("/api/patients/bulk-decision/", {
+        ids: selectedIds,
+        decision,
+        comment: "",
+      });
+      setSelectedIds([]);
+      fetchChanges();
+      fetchStats();
+    } catch (error) {
+      console.error("Ошибка при массовом решении:", error);
+    }
+  };
 
   const handleApprove = async (patientId, role) => {
     try {
@@ -224,6 +355,7 @@ export default function Dashboard() {
       await axiosInstance.post(`/api/patients/${patientId}/approve/`, {
         comment,
       });
+      fetchStats();
 
       setPatients((prev) =>
         prev.map((p) => {
@@ -259,6 +391,7 @@ export default function Dashboard() {
       await axiosInstance.post(`/api/patients/${patientId}/reject/`, {
         comment,
       });
+      fetchStats();
 
       setPatients((prev) =>
         prev.map((p) => {
@@ -285,34 +418,7 @@ export default function Dashboard() {
     }
   };
 
-  const filtered = patients.filter((p) => {
-    const matchesStatus =
-      statusFilter === "Все" ||
-      (statusFilter === "Одобрено" && p.status === "fully_approved") ||
-      (statusFilter === "Отклонено" && p.status === "rejected") ||
-      (statusFilter === "Ожидание" &&
-        (p.status === "waiting" ||
-          p.status === "approved_by_doctor" ||
-          p.status === "approved_by_accountant"));
-    const matchesSearch = p.full_name
-      .toLowerCase()
-      .includes(search.toLowerCase());
-    return matchesStatus && matchesSearch;
-  });
-
-  const total = patients.length;
-  const approved = patients.filter((p) => p.status === "fully_approved").length;
-  const rejected = patients.filter((p) => p.status === "rejected").length;
-  const pending = patients.filter(
-    (p) =>
-      !p.approved_by_doctor ||
-      !p.approved_by_accountant ||
-      p.status === "waiting"
-  ).length;
-
-  const late = patients.filter(
-    (p) => checkLateness(p.created_at, p.status).late
-  ).length;
+  const { total, approved, rejected, pending, late } = stats;
 
   return (
     <div className="min-h-screen bg-gradient-to-br from-slate-50 to-blue-50 p-6">
@@ -414,7 +520,7 @@ export default function Dashboard() {
             <div className="flex flex-wrap gap-4 items-center justify-between">
               <div className="flex gap-4 items-center">
                 <Input
-                  placeholder="Поиск пациентов..."
+                  placeholder="Поиск по ФИО, телефону или ID..."
                   value={search}
                   onChange={(e) => setSearch(e.target.value)}
                   className="max-w-sm border-gray-300 focus:border-blue-500 focus:ring-blue-500"
@@ -429,7 +535,7 @@ export default function Dashboard() {
                     </Button>
                   </DropdownMenuTrigger>
                   <DropdownMenuContent>
-                    {["Все", "Одобрено", "Отклонено", "Ожидание"].map((s) => (
+                    {Object.keys(STATUS_FILTERS).map((s) => (
                       <DropdownMenuItem
                         key={s}
                         onClick={() => setStatusFilter(s)}
@@ -441,6 +547,29 @@ export default function Dashboard() {
                 </DropdownMenu>
               </div>
 
+              {selectedIds.length > 0 && (
+                <div className="flex gap-2 items-center">
+                  <span className="text-sm text-gray-600">
+                    Выбрано: {selectedIds.length}
+                  </span>
+                  <Button
+                    size="sm"
+                    onClick={() => handleBulkDecision("approve")}
+                    className="bg-green-500 hover:bg-green-600 text-white"
+                  >
+                    Одобрить выбранные
+                  </Button>
+                  <Button
+                    size="sm"
+                    variant="outline"
+                    onClick={() => handleBulkDecision("reject")}
+                    className="border-red-500 text-red-500 hover:bg-red-50"
+                  >
+                    Отклонить выбранные
+                  </Button>
+                </div>
+              )}
+
               <div className="flex gap-2">
                 <Button
                   variant={viewMode === "table" ? "default" : "outline"}
@@ -476,6 +605,7 @@ export default function Dashboard() {
               <table className="min-w-full text-sm">
                 <thead className="bg-gray-50">
                   <tr>
+                    <th className="px-4 py-3" />
                     <th className="px-4 py-3 text-left font-semibold text-gray-700">
                       ID Пациента
                     </th>
@@ -512,11 +642,20 @@ export default function Dashboard() {
                   </tr>
                 </thead>
                 <tbody className="divide-y divide-gray-200">
-                  {filtered.map((p) => (
+                  {patients.map((p) => (
                     <tr
                       key={p.id}
                       className="hover:bg-gray-50 transition-colors"
                     >
+                      <td className="px-4 py-3">
+                        {canDecide(p, userRole) && (
+                          <input
+                            type="checkbox"
+                            checked={selectedIds.includes(p.id)}
+                            onChange={() => toggleSelected(p.id)}
+                          />
+                        )}
+                      </td>
                       <td className="px-4 py-3 font-medium text-gray-900">
                         {p.patient_id}
                       </td>
@@ -594,7 +733,7 @@ export default function Dashboard() {
           </Card>
         ) : (
           <div className="grid sm:grid-cols-2 lg:grid-cols-3 gap-6">
-            {filtered.map((p) => (
+            {patients.map((p) => (
               <Card
                 key={p.id}
                 className="bg-white shadow-lg border-0 hover:shadow-xl transition-all duration-300 hover:-translate-y-1"
@@ -695,6 +834,19 @@ export default function Dashboard() {
             ))}
           </div>
         )}
+
+        {nextCursor && (
+          <div className="flex justify-center">
+            <Button
+              variant="outline"
+              disabled={loading}
+              onClick={() => fetchPatients(nextCursor)}
+              className="border-gray-300 hover:bg-gray-50"
+            >
+              {loading ? "Загрузка..." : "Загрузить ещё"}
+            </Button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -4,16 +4,17 @@ import django
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 from django.conf import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 django.setup()
 
+from robot.utils.fsm_storage import build_fsm_storage, build_events_isolation
+
 bot = Bot(
     token=settings.BOT_TOKEN,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+storage = build_fsm_storage()
+dp = Dispatcher(storage=storage, events_isolation=build_events_isolation(storage))
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import BotUser, Patient, CustomUser
+from .models import BotUser, Patient, CustomUser, NotificationOutbox, RegistrationQuota, StateTransition
 
 @admin.register(BotUser)
 class BotUserAdmin(admin.ModelAdmin):
@@ -20,6 +20,7 @@ class PatientAdmin(admin.ModelAdmin):
         'is_rejected',
         'is_fully_approved',
         'status',
+        'archive_status',
     )
     list_filter = (
         'approved_by_doctor',
@@ -29,15 +30,24 @@ class PatientAdmin(admin.ModelAdmin):
         'is_rejected',
         'is_fully_approved',
         'status',
+        'archive_status',
     )
     search_fields = ('full_name', 'phone_number')
-    readonly_fields = ('is_fully_approved', 'is_rejected', 'status', 'patient_id')
+    readonly_fields = ('is_fully_approved', 'is_rejected', 'status', 'patient_id', 'archive_status', 'archive_error', 'archived_at')
 
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)              
         obj.check_full_approval()
 
 
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('chat_id', 'patient', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('chat_id', 'patient__full_name')
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
+
+
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -45,4 +55,17 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ('role', 'is_staff', 'is_superuser')
     fieldsets = UserAdmin.fieldsets + (
         ("Роль пользователя", {"fields": ("role",)}),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(RegistrationQuota)
+class RegistrationQuotaAdmin(admin.ModelAdmin):
+    list_display = ("day", "used")
+    ordering = ("-day",)
+
+@admin.register(StateTransition)
+class StateTransitionAdmin(admin.ModelAdmin):
+    list_display = ("telegram_id", "from_state", "to_state", "is_back", "created_at")
+    list_filter = ("is_back", "to_state")
+    search_fields = ("telegram_id",)
+    ordering = ("-created_at",)
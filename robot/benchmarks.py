@@ -0,0 +1,261 @@
+"""Микро-бенчмарки горячих участков бота. Запуск: python manage.py benchmark <name>"""
+import io
+import time
+
+BENCHMARKS = {}
+
+
+def register_benchmark(name: str):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def measure(func, iterations: int) -> float:
+    """Среднее время одного вызова func в миллисекундах"""
+    func()  # прогрев
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+SAMPLE_QUESTIONNAIRE = {
+    "q1_full_name": "Ivanov Ivan Ivanovich",
+    "q2_birth_date": "01.01.1990",
+    "q3_gender": "Мужской",
+    "q4_phone_number": "+998901234567",
+    "q5_telegram_username": "@ivanov",
+    "q6_region": "Ташкент",
+    "q7_who_applies": "Пациент",
+    "q8_is_sabodarmon": "Нет",
+    "q9_source_info": "Instagram",
+    "q10_has_diagnosis": "Да",
+    "q11_diagnosis_text": "Диагноз " * 20,
+    "q12_diagnosis_file_id": "file-id",
+    "q13_complaint": "Жалобы " * 30,
+    "q14_main_discomfort": "Боль",
+    "q15_improvements": "Смогу работать",
+    "q16_consequences": "Ухудшение",
+    "q17_need_confirmation": "Да",
+    "q17_confirmation_file": "file-id",
+    "q18_avg_income": "1.5",
+    "q18_income_doc": "file-id",
+    "q19_children_count": "3",
+    "q19_children_docs": ["file-id", "file-id", "file-id"],
+    "q21_family_work": "Отец",
+    "q22_housing_type": "Своё",
+    "q22_housing_doc": "file-id",
+    "q23_diagnosis_confirm": "Да",
+    "q24_additional_file": None,
+    "q25_final_comment": "Комментарий",
+}
+
+
+def _pandas_questionnaire_excel(rows: list) -> bytes:
+    """Прежняя реализация через pandas.ExcelWriter — эталон для сравнения"""
+    import pandas as pd
+    from openpyxl.styles import Alignment, Border, Side, PatternFill, Font
+
+    df = pd.DataFrame({'Вопрос': [q for q, _ in rows], 'Ответ': [a for _, a in rows]})
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Анкета', index=False)
+        worksheet = writer.sheets['Анкета']
+        worksheet.column_dimensions['A'].width = 45
+        worksheet.column_dimensions['B'].width = 65
+
+        side = Side(style='thin', color='000000')
+        border = Border(left=side, right=side, top=side, bottom=side)
+        styles = [
+            (PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid"), Font(bold=True, size=11)),
+            (PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid"), Font(size=11)),
+        ]
+        for col in range(1, 3):
+            cell = worksheet.cell(row=1, column=col)
+            cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+            cell.font = Font(color="FFFFFF", bold=True, size=12)
+            cell.border = border
+            cell.alignment = Alignment(wrap_text=True, vertical='center', horizontal='center')
+        for row in range(2, len(df) + 2):
+            for col, (fill, font) in enumerate(styles, start=1):
+                cell = worksheet.cell(row=row, column=col)
+                cell.fill = fill
+                cell.font = font
+                cell.border = border
+                cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
+        for row in range(1, len(df) + 2):
+            worksheet.row_dimensions[row].height = 25
+    return buffer.getvalue()
+
+
+@register_benchmark("excel")
+def benchmark_excel(iterations: int) -> dict:
+    """Генерация Excel анкеты: pandas.ExcelWriter против write-only openpyxl"""
+    from robot.utils.google_drive.excel import build_questionnaire_rows, render_questionnaire_excel
+    from robot.utils.google_drive.local_file_storage import QUESTION_LABELS, QUESTION_FILE_KEYS
+
+    rows = build_questionnaire_rows(SAMPLE_QUESTIONNAIRE, QUESTION_LABELS, QUESTION_FILE_KEYS)
+
+    started = time.perf_counter()
+    import pandas  # noqa: F401
+    pandas_import = (time.perf_counter() - started) * 1000
+
+    return {
+        "pandas import, ms (once)": pandas_import,
+        "pandas, ms/file": measure(lambda: _pandas_questionnaire_excel(rows), iterations),
+        "openpyxl write-only, ms/file": measure(lambda: render_questionnaire_excel(rows), iterations),
+    }
+
+
+def _sample_patient_rows(count: int) -> list:
+    """Строки пациентов в виде, в котором их возвращает QuerySet.values() по всем полям"""
+    from datetime import date, datetime, timezone as dt_timezone
+
+    created_at = datetime(2026, 1, 1, 9, 30, tzinfo=dt_timezone.utc)
+    return [
+        {
+            "id": pk,
+            "patient_id": f"PAT-{pk:06X}",
+            "bot_user_id": pk,
+            "full_name": "Ivanov Ivan Ivanovich",
+            "phone_number": "+998901234567",
+            "birth_date": date(1990, 1, 1),
+            "folder_id": f"/app/questionnaire_storage/{pk}",
+            "created_at": created_at,
+            "updated_at": created_at,
+            "approved_at": None,
+            "approved_by_doctor": True,
+            "approved_by_accountant": False,
+            "is_fully_approved": False,
+            "rejected_by_doctor": False,
+            "rejected_by_accountant": False,
+            "is_rejected": False,
+            "doctor_comment": "Комментарий врача " * 5,
+            "accountant_comment": None,
+            "drive_folder_url": f"https://drive.google.com/drive/folders/{pk}",
+            "status": "approved_by_doctor",
+            "archive_status": "done",
+            "archive_error": None,
+            "archived_at": created_at,
+        }
+        for pk in range(1, count + 1)
+    ]
+
+
+@register_benchmark("serialization")
+def benchmark_serialization(iterations: int) -> dict:
+    """Сериализация 1000 пациентов для списка: ModelSerializer по моделям против PatientListSerializer по values()"""
+    from robot.models import Patient
+    from robot.serializers import PatientSerializer, PatientListSerializer
+
+    rows = _sample_patient_rows(1000)
+    attnames = [field.attname for field in Patient._meta.concrete_fields]
+
+    def model_serializer():
+        instances = [Patient.from_db("default", attnames, [row[name] for name in attnames]) for row in rows]
+        return PatientSerializer(instances, many=True).data
+
+    return {
+        "PatientSerializer + models, ms/1000": measure(model_serializer, iterations),
+        "PatientListSerializer + values(), ms/1000": measure(lambda: PatientListSerializer(rows, many=True).data, iterations),
+        "?fields=id,full_name,status, ms/1000": measure(
+            lambda: PatientListSerializer(rows, many=True, fields=["id", "full_name", "status"]).data, iterations
+        ),
+    }
+
+
+def _legacy_log_handler(func):
+    """Прежний log_handler: inspect.signature и bind на каждый вызов, get_state до хендлера"""
+    import functools
+    import inspect
+
+    from robot.utils.misc.logging import log_error, log_user_action
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        message = None
+        state = None
+
+        sig = inspect.signature(func)
+        bound_args = sig.bind(*args, **kwargs)
+        bound_args.apply_defaults()
+
+        for param_name, param_value in bound_args.arguments.items():
+            if hasattr(param_value, 'from_user') and hasattr(param_value, 'chat'):
+                message = param_value
+            elif hasattr(param_value, 'get_state'):
+                state = param_value
+
+        user_id = message.from_user.id if message and hasattr(message, 'from_user') else 'unknown'
+        current_state = await state.get_state() if state else None
+
+        text_value = getattr(message, 'text', None)
+        if text_value is None:
+            extra = f"Content type: {getattr(message, 'content_type', 'unknown')}"
+        else:
+            extra = f"Text: {text_value[:50]}"
+
+        log_user_action(user_id=user_id, action=f"Handler: {func.__name__}", state=current_state, extra_data=extra)
+
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            log_error(user_id=user_id, error=e, context=f"Handler: {func.__name__}", state=current_state)
+            raise
+
+    return wrapper
+
+
+@register_benchmark("log_handler")
+def benchmark_log_handler(iterations: int) -> dict:
+    """Накладные расходы log_handler на один апдейт (пустой хендлер, 1000 апдейтов)"""
+    import asyncio
+    import logging.handlers
+    from datetime import datetime
+
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiogram.types import Chat, Message, User
+
+    from robot.utils.misc.logging import log_handler, logger
+
+    class DiscardingQueueHandler(logging.handlers.QueueHandler):
+        """Готовит запись как настоящий QueueHandler, но не пишет ее на диск"""
+        def enqueue(self, record):
+            pass
+
+    message = Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=1, type="private"),
+        from_user=User(id=1, is_bot=False, first_name="Ivan"),
+        text="Ivanov Ivan Ivanovich",
+    )
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=1, user_id=1))
+
+    async def handler(message: Message, state: FSMContext):
+        return None
+
+    legacy = _legacy_log_handler(handler)
+    current = log_handler(handler)
+    updates = 1000
+
+    def run(wrapped):
+        async def many():
+            for _ in range(updates):
+                await wrapped(message, state=state)
+        return lambda: asyncio.run(many())
+
+    handlers = logger.handlers[:]
+    logger.handlers = [DiscardingQueueHandler(None)]
+    try:
+        return {
+            "bare handler, us/update": measure(run(handler), iterations) * 1000 / updates,
+            "legacy log_handler, us/update": measure(run(legacy), iterations) * 1000 / updates,
+            "log_handler, us/update": measure(run(current), iterations) * 1000 / updates,
+        }
+    finally:
+        logger.handlers = handlers
@@ -1,14 +1,14 @@
 from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.types import ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton
-from asgiref.sync import sync_to_async
 from django.utils import timezone
-from datetime import timedelta
-from django.utils.timezone import now
 
 from robot.states import RegisterStates, QuestionnaireStates
 from robot.models import BotUser, Patient
+from robot.services.registration_quota import create_bot_user_within_quota
+from robot.utils.db_api import db_call
 from robot.utils.misc.logging import logger, log_user_action, log_state_change, log_handler, log_error
+from robot.services.funnel import record_transition
 
 
 
@@ -31,6 +31,7 @@ async def confirm_honesty(message: types.Message, state: FSMContext):
         old_state = await state.get_state()
         await state.set_state(RegisterStates.full_name)
         log_state_change(user_id, old_state, "RegisterStates.full_name")
+        record_transition(user_id, old_state, "RegisterStates.full_name")
         
     except Exception as e:
         log_error(user_id, e, "confirm_honesty handler", "RegisterStates.confirm_honesty")
@@ -86,18 +87,12 @@ async def get_fullname_and_ask_phone(message: types.Message, state: FSMContext):
         old_state = await state.get_state()
         await state.set_state(RegisterStates.phone_number)
         log_state_change(user_id, old_state, "RegisterStates.phone_number")
+        record_transition(user_id, old_state, "RegisterStates.phone_number")
         
     except Exception as e:
         log_error(user_id, e, "get_fullname_and_ask_phone handler", "RegisterStates.full_name")
         raise
 
-async def can_register_new_patient():
-    today = now().date()
-    count_today = await sync_to_async(
-        lambda: BotUser.objects.filter(created_at__date=today).count()
-    )()
-    return count_today < 20
-
 @router.message(RegisterStates.phone_number, F.contact)
 async def get_phone_number_and_confirm_rules(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
@@ -118,18 +113,18 @@ async def get_phone_number_and_confirm_rules(message: types.Message, state: FSMC
         telegram_id = message.from_user.id
 
         # Проверка на уже зарегистрированного пользователя
-        existing_user = await sync_to_async(BotUser.objects.filter(
+        existing_user = await db_call(BotUser.objects.filter(
             telegram_id=telegram_id,
             phone_number=phone_number
-        ).first)()
+        ).first)
 
         if existing_user:
             # Проверяем есть ли у пользователя пациент (должен быть только один)
             try:
-                existing_patient = await sync_to_async(lambda: existing_user.patient)()
+                existing_patient = await db_call(lambda: existing_user.patient, operation="BotUser.patient")
                 
                 # Проверяем может ли подать новую анкету
-                can_register = await sync_to_async(existing_patient.can_register_again)()
+                can_register = await db_call(existing_patient.can_register_again)
                 
                 if not can_register:
                     if existing_patient.is_fully_approved:
@@ -154,34 +149,33 @@ async def get_phone_number_and_confirm_rules(message: types.Message, state: FSMC
                             "Вы можете снова пройти регистрацию, однако необходимо указать другой диагноз, отличный от предыдущего.\nВ противном случае анкета будет отклонена повторно."
                         )
                         # Удаляем старую запись пациента для создания новой
-                        await sync_to_async(existing_patient.delete)()
+                        await db_call(existing_patient.delete)
                     elif existing_patient.is_fully_approved:
                         await message.answer(
                             "✅ Прошло 7 месяцев с момента одобрения. "
                             "Вы можете подать новую анкету."
                         )
                         # Удаляем старую запись пациента для создания новой
-                        await sync_to_async(existing_patient.delete)()
+                        await db_call(existing_patient.delete)
                         
             except Patient.DoesNotExist:
                 # У пользователя нет записи пациента, можно создать
                 await message.answer("✅ Вы уже зарегистрированы. Переходим к анкете.")
         else:
-            can_register_today = await can_register_new_patient()
-            if not can_register_today:
+            # Новый пользователь: место в дневном лимите занимается атомарно вместе с созданием
+            bot_user = await db_call(
+                create_bot_user_within_quota,
+                telegram_id=telegram_id,
+                full_name=full_name,
+                phone_number=phone_number
+            )
+            if bot_user is None:
                 await message.answer(
                     "❗ Сегодня достигнут лимит регистрации.\n"
                     "Пожалуйста, попробуйте снова завтра."
                 )
                 return
 
-            # Новый пользователь
-            await sync_to_async(BotUser.objects.create)(
-                telegram_id=telegram_id,
-                full_name=full_name,
-                phone_number=phone_number
-            )
-
         # Показываем правила и переходим к анкете
         await message.answer(
             "✅ Спасибо!\n\n"
@@ -201,6 +195,7 @@ async def get_phone_number_and_confirm_rules(message: types.Message, state: FSMC
         old_state = await state.get_state()
         await state.set_state(QuestionnaireStates.ConfirmRules)
         log_state_change(user_id, old_state, "QuestionnaireStates.ConfirmRules")
+        record_transition(user_id, old_state, "QuestionnaireStates.ConfirmRules")
 
         logger.info(f"User {user_id} successfully processed registration and moved to questionnaire")
 
@@ -6,6 +6,7 @@ from aiogram.fsm.context import FSMContext
 from robot.keyboards.default.user_register import honesty_kb
 from robot.states import RegisterStates
 from robot.utils.misc.logging import logger, log_user_action, log_state_change, log_handler
+from robot.services.funnel import record_transition
 
 router = Router()
 
@@ -32,6 +33,7 @@ async def bot_start(message: Message, state: FSMContext):
         old_state = await state.get_state()
         await state.set_state(RegisterStates.confirm_honesty)
         log_state_change(user_id, old_state, "RegisterStates.confirm_honesty")
+        record_transition(user_id, old_state, "RegisterStates.confirm_honesty")
         
         logger.info(f"Welcome message sent successfully to user {user_id}")
         
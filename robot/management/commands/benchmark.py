@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from robot.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Run a micro-benchmark with: python manage.py benchmark <name>'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help='Имя бенчмарка; без имени выводится список')
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        name = options['name']
+        if not name:
+            for bench_name, func in sorted(BENCHMARKS.items()):
+                self.stdout.write(f"{bench_name}: {func.__doc__ or ''}")
+            return
+
+        if name not in BENCHMARKS:
+            raise CommandError(f"Unknown benchmark '{name}'. Available: {', '.join(sorted(BENCHMARKS))}")
+
+        results = BENCHMARKS[name](options['iterations'])
+        for label, value in results.items():
+            self.stdout.write(f"{label:<40} {value:10.3f}")
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from robot.models import BotUser, Patient, StateTransition
+
+
+def hot_queries():
+    """Горячие запросы бота и API и индексы, которые они должны использовать"""
+    day_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        (
+            "Patient list page",
+            Patient.objects.order_by("-created_at", "-id")[:51],
+            ["robot_patient_created_id_idx"],
+        ),
+        (
+            "Patient list filtered by status",
+            Patient.objects.filter(status__in=["rejected"]).order_by("-created_at", "-id")[:51],
+            ["robot_patient_status_idx"],
+        ),
+        (
+            "Waiting queue",
+            Patient.objects.filter(status="waiting").order_by("-created_at")[:51],
+            ["robot_patient_waiting_idx", "robot_patient_status_idx"],
+        ),
+        (
+            "Existing patient lookup",
+            Patient.objects.filter(full_name="x", phone_number="x", birth_date="2000-01-01"),
+            ["robot_patient_identity_idx"],
+        ),
+        (
+            "Dashboard changes since cursor",
+            Patient.objects.filter(updated_at__gt=day_start).order_by("updated_at", "id")[:51],
+            ["robot_patient_updated_idx"],
+        ),
+        (
+            "Registrations today",
+            BotUser.objects.filter(created_at__gte=day_start, created_at__lt=day_start + timedelta(days=1)),
+            ["robot_botuser_created_idx"],
+        ),
+        (
+            "Funnel transitions for the period",
+            StateTransition.objects.filter(created_at__gte=day_start - timedelta(days=30)),
+            ["robot_transition_created_idx"],
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Check with EXPLAIN that hot queries use their indexes: python manage.py explainqueries [--verbose]'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose', action='store_true', help='Печатать полный план запроса')
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # На маленькой таблице планировщик честно выберет Seq Scan; проверяем, что индекс применим
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for title, queryset, expected_indexes in hot_queries():
+                plan = queryset.explain()
+                used = [name for name in expected_indexes if name in plan]
+                if used:
+                    self.stdout.write(self.style.SUCCESS(f"✅ {title}: {used[0]}"))
+                else:
+                    failures.append(title)
+                    self.stdout.write(self.style.ERROR(f"❌ {title}: expected one of {', '.join(expected_indexes)}"))
+                if options['verbose'] or not used:
+                    self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f"Queries without index: {', '.join(failures)}")
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from robot.services.funnel import build_funnel, load_transitions
+from robot.utils.question_flow import STATE_ORDER
+
+
+class Command(BaseCommand):
+    help = 'Questionnaire funnel from stored state transitions: python manage.py funnel [--days 30] [--csv funnel.csv]'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='За сколько последних дней брать переходы')
+        parser.add_argument('--idle-hours', type=float, default=24,
+                            help='Через сколько часов без активности пользователь считается ушедшим')
+        parser.add_argument('--csv', help='Сохранить таблицу в CSV')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        transitions = load_transitions(since=now - timedelta(days=options['days']))
+        table, totals = build_funnel(
+            transitions, STATE_ORDER, now=now, idle=timedelta(hours=options['idle_hours'])
+        )
+
+        self.stdout.write(
+            f"Transitions: {len(transitions)} | users: {totals['users']} | started: {totals['started']} | "
+            f"completed: {totals['completed']} | in progress: {totals['in_progress']}"
+        )
+        self.stdout.write(table.to_string(
+            formatters={
+                "drop_rate": "{:.1%}".format,
+                "back_rate": "{:.1%}".format,
+                "median_seconds": "{:.1f}".format,
+            },
+            na_rep="-",
+        ))
+
+        if options['csv']:
+            table.to_csv(options['csv'])
+            self.stdout.write(self.style.SUCCESS(f"✅ Saved to {options['csv']}"))
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Тяжелые зависимости, которые не должны загружаться при старте бота
+HEAVY_MODULES = ('pandas', 'numpy', 'googleapiclient', 'google.oauth2')
+
+
+def parse_importtime(output: str) -> dict:
+    """Разбирает вывод python -X importtime в {модуль: (self_us, cumulative_us)}"""
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Report import time of the bot with: python manage.py importtime [--module ...] [--budget ms]'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='robot.management.commands.runbot', help='Модуль, импорт которого измеряется')
+        parser.add_argument('--budget', type=int, default=settings.IMPORT_TIME_BUDGET_MS, help='Бюджет времени импорта, мс')
+        parser.add_argument('--top', type=int, default=15, help='Сколько самых тяжелых модулей показать')
+
+    def handle(self, *args, **options):
+        # Замер в отдельном процессе: в текущем большая часть модулей уже загружена
+        code = f"import django; django.setup(); import {options['module']}"
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings')}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Import failed:\n{result.stderr[-2000:]}")
+
+        modules = parse_importtime(result.stderr)
+        total_ms = sum(self_us for self_us, _ in modules.values()) / 1000
+
+        self.stdout.write(f"{'cumulative, ms':>15} {'self, ms':>10}  module")
+        heaviest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:options['top']]
+        for name, (self_us, cumulative_us) in heaviest:
+            self.stdout.write(f"{cumulative_us / 1000:15.1f} {self_us / 1000:10.1f}  {name}")
+
+        loaded_heavy = [name for name in HEAVY_MODULES if name in modules]
+        self.stdout.write(f"\nModules imported: {len(modules)}, total: {total_ms:.0f} ms, budget: {options['budget']} ms")
+        if loaded_heavy:
+            self.stdout.write(self.style.WARNING(f"Heavy modules loaded at startup: {', '.join(loaded_heavy)}"))
+
+        if total_ms > options['budget']:
+            raise CommandError(f"Import time {total_ms:.0f} ms exceeds budget of {options['budget']} ms")
+        self.stdout.write(self.style.SUCCESS("✅ Import time within budget"))
@@ -1,7 +1,7 @@
 import asyncio
 import os
 import django
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 django.setup()
@@ -10,35 +10,70 @@ from django.conf import settings
 
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.client.default import DefaultBotProperties 
+from aiogram.client.default import DefaultBotProperties
 
 from robot.handlers import register_all_handlers
 from robot.utils.set_bot_commands import set_default_commands
 from robot.utils.notify_admins import on_startup_notify
+from robot.utils.fsm_storage import build_fsm_storage, build_events_isolation
+from robot.utils.webhook import run_webhook
 
 from robot.middlewares.throttling import ThrottlingMiddleware
+from robot.middlewares.metrics import MetricsMiddleware
+from robot.utils.misc.metrics import start_metrics_server
 
 class Command(BaseCommand):
-    help = 'Run the Telegram bot with: python manage.py runbot'
+    help = 'Run the Telegram bot with: python manage.py runbot [--webhook]'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--webhook', action='store_true', help='Принимать апдейты через webhook вместо polling')
+        parser.add_argument('--workers', type=int, default=settings.BOT_WORKERS, help='Количество воркеров в webhook-режиме')
+        parser.add_argument('--queue-size', type=int, default=settings.BOT_QUEUE_SIZE, help='Размер очереди каждого воркера')
+        parser.add_argument('--host', default=settings.WEBHOOK_HOST)
+        parser.add_argument('--port', type=int, default=settings.WEBHOOK_PORT)
 
     def handle(self, *args, **options):
-        asyncio.run(self.main())
+        if options['webhook'] and not settings.WEBHOOK_BASE_URL:
+            raise CommandError('WEBHOOK_BASE_URL is not set')
+        asyncio.run(self.main(options))
 
-    async def main(self):
+    async def main(self, options):
         bot = Bot(
             token=settings.BOT_TOKEN,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
 
-        dp = Dispatcher(storage=MemoryStorage())
+        storage = build_fsm_storage()
+        dp = Dispatcher(storage=storage, events_isolation=build_events_isolation(storage))
 
-        dp.message.middleware.register(ThrottlingMiddleware(rate_limit=1.0))
+        dp.message.middleware.register(ThrottlingMiddleware())
+        dp.message.middleware.register(MetricsMiddleware())
+        dp.callback_query.middleware.register(MetricsMiddleware())
 
         register_all_handlers(dp)
 
         await set_default_commands(bot)
         await on_startup_notify(bot)
 
+        metrics_runner = None
+        if settings.METRICS_PORT:
+            metrics_runner = await start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT)
+
         self.stdout.write(self.style.SUCCESS("🚀 Бот запущен"))
-        await dp.start_polling(bot)
+
+        try:
+            if options['webhook']:
+                await run_webhook(
+                    dp,
+                    bot,
+                    host=options['host'],
+                    port=options['port'],
+                    workers=options['workers'],
+                    queue_size=options['queue_size'],
+                )
+            else:
+                await bot.delete_webhook()
+                await dp.start_polling(bot)
+        finally:
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from robot.services.notification_sender import NotificationSender
+
+
+class Command(BaseCommand):
+    help = 'Send queued Telegram notifications with: python manage.py sendnotifications [--once]'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Отправить накопившиеся уведомления и выйти')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Пауза между проверками очереди, с')
+
+    def handle(self, *args, **options):
+        sender = NotificationSender()
+        if options['once']:
+            self.stdout.write(str(sender.drain()))
+            return
+        self.stdout.write("📨 Notification sender started")
+        sender.run(options['poll_interval'])
@@ -0,0 +1,46 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from robot.utils.misc.logging import log_event
+from robot.utils.misc.metrics import HANDLER_SECONDS
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Замеряет время каждого хендлера.
+
+    Длительность попадает в гистограмму sabo_bot_handler_duration_seconds с метками
+    хендлера и состояния FSM (шага анкеты) и в событие handler_finished.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = getattr(data.get("handler"), "callback", None)
+        handler_name = getattr(callback, "__name__", "unknown")
+        state = data.get("raw_state") or "none"
+        from_user = getattr(event, "from_user", None)
+
+        status = "ok"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            HANDLER_SECONDS.observe(duration, handler=handler_name, state=state, status=status)
+            log_event(
+                "handler_finished",
+                user_id=from_user.id if from_user else None,
+                state=state,
+                handler=handler_name,
+                status=status,
+                duration_ms=round(duration * 1000, 2),
+            )
@@ -1,30 +1,158 @@
-import asyncio
-from aiogram import BaseMiddleware
-from aiogram.types import Message
-from typing import Callable, Dict, Any
-import time
-
-
-class ThrottlingMiddleware(BaseMiddleware):
-    def __init__(self, rate_limit: float = 2.0):
-        self.rate_limit = rate_limit
-        self._last_called: Dict[int, float] = {}
-
-    async def __call__(
-        self,
-        handler: Callable[[Message, Dict[str, Any]], Any],
-        message: Message,
-        data: Dict[str, Any]
-    ) -> Any:
-        user_id = message.from_user.id
-        now = time.time()
-
-        last_time = self._last_called.get(user_id, 0)
-        delta = now - last_time
-
-        if delta < self.rate_limit:
-            await message.answer("⏱ Пожалуйста, не так быстро. Подождите немного...")
-            return
-
-        self._last_called[user_id] = now
-        return await handler(message, data)
+import logging
+import time
+from typing import Any, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+from cachetools import TTLCache
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryThrottleBackend:
+    """Token bucket в памяти процесса.
+
+    Корзины хранятся в TTLCache: неактивные пользователи вытесняются по времени,
+    а при переполнении — самые старые, поэтому память ограничена maxsize.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 600):
+        self._buckets = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._marks = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def consume(self, key: str, interval: float, capacity: int) -> float:
+        """Забирает токен; возвращает 0, если запрос разрешен, иначе сколько секунд ждать"""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) / interval)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) * interval
+        self._buckets[key] = (tokens, now)
+        return wait
+
+    async def mark(self, key: str, ttl: float) -> bool:
+        """True, если метки key не было последние ttl секунд (и ставит ее)"""
+        now = time.monotonic()
+        if self._marks.get(key, 0) > now:
+            return False
+        self._marks[key] = now + ttl
+        return True
+
+
+class RedisThrottleBackend:
+    """Token bucket в Redis: лимиты общие для всех воркеров бота и переживают перезапуск"""
+
+    # Пополнение и списание токена атомарно на стороне Redis по его часам
+    CONSUME_SCRIPT = """
+    local interval = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) / interval)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) * interval
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * interval * 1000))
+    return tostring(wait)
+    """
+
+    def __init__(self, redis, prefix: str = "sabo_throttle"):
+        self.redis = redis
+        self.prefix = prefix
+        self._consume = redis.register_script(self.CONSUME_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs):
+        from redis.asyncio import Redis
+
+        return cls(Redis.from_url(url), **kwargs)
+
+    async def consume(self, key: str, interval: float, capacity: int) -> float:
+        wait = await self._consume(keys=[f"{self.prefix}:{key}"], args=[interval, capacity])
+        return float(wait)
+
+    async def mark(self, key: str, ttl: float) -> bool:
+        # Redis не принимает px=0, поэтому метка живет хотя бы 1 мс
+        return bool(await self.redis.set(f"{self.prefix}:mark:{key}", 1, px=max(1, int(ttl * 1000)), nx=True))
+
+
+def build_throttle_backend(backend: str = None):
+    """Создает хранилище лимитов согласно settings.THROTTLE_STORAGE ("redis" или "memory")"""
+    backend = (backend or settings.THROTTLE_STORAGE).lower()
+
+    if backend == "memory":
+        return MemoryThrottleBackend(maxsize=settings.THROTTLE_CACHE_SIZE)
+
+    if backend == "redis":
+        return RedisThrottleBackend.from_url(settings.REDIS_URL)
+
+    raise ValueError(f"❌ Unknown throttle storage backend: {backend}")
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Ограничивает частоту сообщений пользователя (token bucket).
+
+    rate_limit — секунд на одно сообщение, burst — сколько сообщений подряд можно
+    отправить без паузы (например, альбом документов). Обработчик может задать свой
+    лимит и отдельную корзину декоратором robot.utils.misc.rate_limit(limit, key).
+    Предупреждение "не так быстро" отправляется не чаще раза в warning_cooldown секунд.
+    Лимит 0 (или меньше) означает "без ограничения".
+    """
+
+    def __init__(self, rate_limit: float = None, burst: int = None, warning_cooldown: float = None, backend=None):
+        self.rate_limit = settings.THROTTLE_RATE_LIMIT if rate_limit is None else rate_limit
+        self.burst = settings.THROTTLE_BURST if burst is None else burst
+        if self.burst < 1:
+            # Пустая корзина не пропустила бы ни одного сообщения
+            raise ValueError(f"❌ Throttle burst must be at least 1, got {self.burst}")
+        self.warning_cooldown = settings.THROTTLE_WARNING_COOLDOWN if warning_cooldown is None else warning_cooldown
+        self.backend = backend or build_throttle_backend()
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Any],
+        message: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        if message.from_user is None:
+            return await handler(message, data)
+
+        user_id = message.from_user.id
+        callback = getattr(data.get("handler"), "callback", None)
+        limit = getattr(callback, "throttling_rate_limit", self.rate_limit)
+        key = getattr(callback, "throttling_key", "message")
+
+        if limit is None or limit <= 0:
+            return await handler(message, data)
+
+        try:
+            wait = await self.backend.consume(f"{key}:{user_id}", limit, self.burst)
+        except Exception as e:
+            # Недоступное хранилище лимитов не должно останавливать бота
+            logger.warning(f"Throttling backend error, message from {user_id} allowed: {e}")
+            return await handler(message, data)
+
+        if wait > 0:
+            # Лимит уже превышен: ошибка метки предупреждения не пропускает сообщение
+            try:
+                warn = await self.backend.mark(f"warned:{user_id}", self.warning_cooldown)
+            except Exception as e:
+                logger.warning(f"Throttling backend error, warning to {user_id} skipped: {e}")
+                warn = False
+            if warn:
+                await message.answer("⏱ Пожалуйста, не так быстро. Подождите немного...")
+            return
+
+        return await handler(message, data)
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='archive_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        # Анкеты, созданные до появления фоновой задачи, уже сохранены синхронно
+        migrations.AddField(
+            model_name='patient',
+            name='archive_status',
+            field=models.CharField(choices=[('pending', '⏳ В очереди'), ('processing', '🔄 Сохраняется'), ('retrying', '🔁 Повторная попытка'), ('done', '✅ Сохранено'), ('failed', '❌ Ошибка сохранения')], default='done', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='archive_status',
+            field=models.CharField(choices=[('pending', '⏳ В очереди'), ('processing', '🔄 Сохраняется'), ('retrying', '🔁 Повторная попытка'), ('done', '✅ Сохранено'), ('failed', '❌ Ошибка сохранения')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot', '0003_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='botuser',
+            index=models.Index(fields=['created_at'], name='robot_botuser_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['-created_at', '-id'], name='robot_patient_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['status', '-created_at'], name='robot_patient_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('status', 'waiting')), fields=['-created_at'], name='robot_patient_waiting_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['full_name', 'phone_number', 'birth_date'], name='robot_patient_identity_idx'),
+        ),
+    ]
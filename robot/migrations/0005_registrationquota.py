@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:46
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def seed_today(apps, schema_editor):
+    """Учитываем в счетчике пользователей, уже зарегистрированных сегодня"""
+    BotUser = apps.get_model('robot', 'BotUser')
+    RegistrationQuota = apps.get_model('robot', 'RegistrationQuota')
+    day_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    used = BotUser.objects.filter(created_at__gte=day_start, created_at__lt=day_start + timedelta(days=1)).count()
+    if used:
+        RegistrationQuota.objects.create(day=day_start.date(), used=used)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot', '0004_patient_botuser_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('used', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_today, migrations.RunPython.noop),
+    ]
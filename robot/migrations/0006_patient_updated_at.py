@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:48
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    """Для существующих анкет время изменения неизвестно — берем время создания"""
+    Patient = apps.get_model('robot', 'Patient')
+    Patient.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot', '0005_registrationquota'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['updated_at', 'id'], name='robot_patient_updated_idx'),
+        ),
+    ]
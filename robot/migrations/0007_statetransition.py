@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('robot', '0006_patient_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StateTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('telegram_id', models.BigIntegerField()),
+                ('from_state', models.CharField(blank=True, max_length=64)),
+                ('to_state', models.CharField(blank=True, max_length=64)),
+                ('is_back', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='robot_transition_created_idx')],
+            },
+        ),
+    ]
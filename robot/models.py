@@ -1,5 +1,7 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Now
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from datetime import timedelta
@@ -10,6 +12,12 @@ class BotUser(models.Model):
     phone_number = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Подсчет регистраций за день (диапазон по created_at)
+            models.Index(fields=["created_at"], name="robot_botuser_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.full_name} ({self.phone_number})"
 
@@ -23,7 +31,142 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.role})"
 
-class Patient(models.Model):
+class FieldTrackerMixin:
+    """Запоминает значения полей при загрузке из БД.
+
+    Позволяет узнать прежнее значение поля и список измененных полей без
+    повторного SELECT, а save() записывает только измененные поля.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def _take_snapshot(self, attnames=None):
+        loaded = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__ and (attnames is None or field.attname in attnames)
+        }
+        if attnames is None or not hasattr(self, "_loaded_values"):
+            self._loaded_values = loaded
+        else:
+            self._loaded_values.update(loaded)
+
+    def get_original_value(self, attname: str, default=None):
+        """Значение поля на момент загрузки из БД (или последнего сохранения)"""
+        return getattr(self, "_loaded_values", {}).get(attname, default)
+
+    def get_changed_fields(self) -> list:
+        loaded = getattr(self, "_loaded_values", {})
+        return [
+            attname for attname, value in loaded.items()
+            if self.__dict__.get(attname, value) != value
+        ]
+
+    def save(self, *args, **kwargs):
+        # Для уже загруженной записи обновляем только измененные поля
+        if (
+            not self._state.adding
+            and hasattr(self, "_loaded_values")
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+            and not args
+        ):
+            changed = self.get_changed_fields()
+            if changed:
+                # Поля auto_now (например, updated_at) обновляются при любом изменении записи
+                changed += [
+                    field.name for field in self._meta.concrete_fields
+                    if getattr(field, "auto_now", False) and field.attname not in changed
+                ]
+            kwargs["update_fields"] = changed
+
+        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get("update_fields")
+        self._take_snapshot(None if update_fields is None else {
+            self._meta.get_field(name).attname for name in update_fields
+        })
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._take_snapshot(None if fields is None else {
+            self._meta.get_field(name).attname for name in fields
+        })
+
+# Роль проверяющего -> роль второго проверяющего
+REVIEWER_ROLES = {"doctor": "accountant", "accountant": "doctor"}
+
+class PatientQuerySet(models.QuerySet):
+    def _decision_values(self, role: str, approve: bool, comment: str) -> dict:
+        """Выражения для UPDATE: новый статус считается в SQL по текущим флагам строки"""
+        other = REVIEWER_ROLES[role]
+        values = {f"{role}_comment": comment, "updated_at": Now()}
+
+        if not approve:
+            # Отказ любого проверяющего снимает оба одобрения (как Patient.reject)
+            values.update({
+                f"rejected_by_{role}": True,
+                "approved_by_doctor": False,
+                "approved_by_accountant": False,
+                "is_rejected": True,
+                "is_fully_approved": False,
+                "approved_at": None,
+                "status": "rejected",
+            })
+            return values
+
+        other_rejected = Q(**{f"rejected_by_{other}": True})
+        other_approved = Q(**{f"approved_by_{other}": True, f"rejected_by_{other}": False})
+        values.update({
+            f"approved_by_{role}": True,
+            f"rejected_by_{role}": False,
+            "is_rejected": Case(When(other_rejected, then=Value(True)), default=Value(False)),
+            "is_fully_approved": Case(When(other_approved, then=Value(True)), default=Value(False)),
+            # Дата одобрения ставится только при первом полном одобрении
+            "approved_at": Case(
+                When(other_approved & Q(is_fully_approved=False), then=Now()),
+                When(other_approved, then=F("approved_at")),
+                default=Value(None),
+            ),
+            "status": Case(
+                When(other_rejected, then=Value("rejected")),
+                When(other_approved, then=Value("fully_approved")),
+                default=Value(f"approved_by_{role}"),
+            ),
+        })
+        return values
+
+    def apply_decision(self, role: str, approve: bool, comment: str = "") -> list:
+        """Применяет решение врача или бухгалтера ко всем пациентам выборки одним UPDATE.
+
+        Строки блокируются до конца транзакции, поэтому одновременные решения
+        врача и бухгалтера не перезаписывают флаги друг друга. Возвращает список
+        (пациент, прежний статус, новый статус), где пациент прочитан в той же транзакции,
+        и рассылает сигнал patient_status_changed со списком (pk, прежний статус, новый статус).
+        """
+        if role not in REVIEWER_ROLES:
+            raise ValueError(f"Unknown reviewer role: {role!r}")
+
+        from .signals import patient_status_changed
+
+        with transaction.atomic():
+            previous = dict(self.select_for_update().values_list("pk", "status"))
+            if not previous:
+                return []
+
+            locked = self.model.objects.filter(pk__in=previous)
+            locked.update(**self._decision_values(role, approve, comment))
+            patients = list(locked)
+            changes = [(patient.pk, previous[patient.pk], patient.status) for patient in patients]
+            patient_status_changed.send(sender=self.model, changes=changes, role=role, approve=approve)
+
+        return [(patient, previous[patient.pk], patient.status) for patient in patients]
+
+class Patient(FieldTrackerMixin, models.Model):
     patient_id = models.CharField(max_length=20, unique=True, editable=False)
     bot_user = models.OneToOneField('BotUser', on_delete=models.CASCADE, related_name="patient")  # Изменено на OneToOneField
     full_name = models.CharField(max_length=255)
@@ -31,6 +174,9 @@ class Patient(models.Model):
     birth_date = models.DateField()
     folder_id = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Время последнего изменения для дельта-синхронизации панели (/api/patients/changes/).
+    # UPDATE через QuerySet.update() должен выставлять его явно
+    updated_at = models.DateTimeField(auto_now=True)
     
     # Добавить поле для отслеживания даты одобрения
     approved_at = models.DateTimeField(null=True, blank=True)
@@ -61,16 +207,45 @@ class Patient(models.Model):
     ]
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default="waiting")
 
+    # Архивирование анкеты (фоновая задача robot.tasks.archive_questionnaire)
+    ARCHIVE_STATUS_CHOICES = [
+        ("pending", "⏳ В очереди"),
+        ("processing", "🔄 Сохраняется"),
+        ("retrying", "🔁 Повторная попытка"),
+        ("done", "✅ Сохранено"),
+        ("failed", "❌ Ошибка сохранения"),
+    ]
+    archive_status = models.CharField(max_length=20, choices=ARCHIVE_STATUS_CHOICES, default="pending")
+    archive_error = models.TextField(blank=True, null=True)
+    archived_at = models.DateTimeField(null=True, blank=True)
+
+    objects = PatientQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Постраничный список: ORDER BY created_at DESC, id DESC и курсор по этой паре
+            models.Index(fields=["-created_at", "-id"], name="robot_patient_created_id_idx"),
+            # Фильтр по статусу с той же сортировкой и GROUP BY status для статистики
+            models.Index(fields=["status", "-created_at"], name="robot_patient_status_idx"),
+            # Очередь новых анкет: небольшой частичный индекс только по ожидающим
+            models.Index(fields=["-created_at"], condition=Q(status="waiting"), name="robot_patient_waiting_idx"),
+            # Поиск существующего пациента при завершении анкеты
+            models.Index(fields=["full_name", "phone_number", "birth_date"], name="robot_patient_identity_idx"),
+            # Дельта-синхронизация: WHERE (updated_at, id) > курсор ORDER BY updated_at, id
+            models.Index(fields=["updated_at", "id"], name="robot_patient_updated_idx"),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.patient_id:
             self.patient_id = f"PAT-{uuid.uuid4().hex[:6].upper()}"
         
-        # Обновляем дату одобрения при полном одобрении
-        old_fully_approved = False
-        if self.pk:
-            old_instance = Patient.objects.get(pk=self.pk)
-            old_fully_approved = old_instance.is_fully_approved
-        
+        # Обновляем дату одобрения при полном одобрении; прежнее значение берем из снимка при загрузке
+        if self._state.adding or hasattr(self, "_loaded_values"):
+            old_fully_approved = self.get_original_value("is_fully_approved", False)
+        else:
+            # Объект создан вручную с pk, снимка нет
+            old_fully_approved = Patient.objects.filter(pk=self.pk).values_list("is_fully_approved", flat=True).first() or False
+
         self.update_status()
         
         # Устанавливаем дату одобрения при первом полном одобрении
@@ -91,9 +266,11 @@ class Patient(models.Model):
         elif self.approved_by_doctor:
             self.status = "approved_by_doctor"
             self.is_rejected = False
+            self.is_fully_approved = False
         elif self.approved_by_accountant:
             self.status = "approved_by_accountant"
             self.is_rejected = False
+            self.is_fully_approved = False
         else:
             self.status = "waiting"
             self.is_rejected = False
@@ -112,24 +289,23 @@ class Patient(models.Model):
             # Если анкета на рассмотрении, не может подать новую
             return False
 
+    def apply_decision(self, role: str, approve: bool, comment: str = "") -> tuple:
+        """Атомарно применяет решение проверяющего и обновляет объект из БД.
+        Возвращает (прежний статус, новый статус)."""
+        changes = Patient.objects.filter(pk=self.pk).apply_decision(role, approve, comment)
+        self.refresh_from_db()
+        if not changes:
+            return self.status, self.status
+        _, previous_status, new_status = changes[0]
+        return previous_status, new_status
+
+    def approve(self, by: str, comment: str = ""):
+        """Одобряет пациента от имени врача или бухгалтера"""
+        return self.apply_decision(by, approve=True, comment=comment)
+
     def reject(self, by: str, comment: str = ""):
         """Отклоняет пациента с комментарием от врача или бухгалтера"""
-        if by == "doctor":
-            self.rejected_by_doctor = True
-            self.approved_by_doctor = False
-            self.doctor_comment = comment
-        elif by == "accountant":
-            self.rejected_by_accountant = True
-            self.approved_by_accountant = False
-            self.accountant_comment = comment
-
-        self.is_rejected = True
-        self.approved_by_doctor = False
-        self.approved_by_accountant = False
-        self.is_fully_approved = False
-        self.approved_at = None  # Сбрасываем дату одобрения
-
-        self.save()
+        return self.apply_decision(by, approve=False, comment=comment)
 
     def check_full_approval(self):
         self.is_fully_approved = (
@@ -140,4 +316,58 @@ class Patient(models.Model):
         self.save()
 
     def __str__(self):
-        return f"{self.full_name} ({self.phone_number})"
\ No newline at end of file
+        return f"{self.full_name} ({self.phone_number})"
+
+class NotificationOutbox(models.Model):
+    """Очередь исходящих уведомлений в Telegram (отправляет python manage.py sendnotifications)"""
+    STATUS_CHOICES = [
+        ("pending", "⏳ В очереди"),
+        ("sent", "✅ Отправлено"),
+        ("failed", "❌ Ошибка отправки"),
+    ]
+
+    patient = models.ForeignKey('Patient', on_delete=models.SET_NULL, null=True, blank=True, related_name="notifications")
+    chat_id = models.BigIntegerField()
+    text = models.TextField()
+    parse_mode = models.CharField(max_length=20, default="HTML")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.chat_id}: {self.get_status_display()}"
+
+class RegistrationQuota(models.Model):
+    """Счетчик новых регистраций за день: лимит проверяется и расходуется одним UPDATE"""
+    day = models.DateField(unique=True)
+    used = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.used}"
+
+
+class StateTransition(models.Model):
+    """Переход пользователя между состояниями FSM (только добавление) — данные для воронки анкеты"""
+    telegram_id = models.BigIntegerField()
+    from_state = models.CharField(max_length=64, blank=True)
+    # Пустое значение — анкета завершена
+    to_state = models.CharField(max_length=64, blank=True)
+    is_back = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Выборка переходов за период для python manage.py funnel
+            models.Index(fields=["created_at"], name="robot_transition_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.telegram_id}: {self.from_state} -> {self.to_state}"
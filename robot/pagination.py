@@ -0,0 +1,168 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по ключу (created_at, id), от новых к старым.
+
+    Следующая страница выбирается условием WHERE (created_at, id) < курсор,
+    а не OFFSET, поэтому время запроса не растет с номером страницы, а
+    добавленные во время просмотра записи не сдвигают выдачу.
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+    ordering_field = "created_at"
+    descending = True
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self) -> tuple:
+        prefix = "-" if self.descending else ""
+        return f"{prefix}{self.ordering_field}", f"{prefix}id"
+
+    def filter_after(self, queryset, value: datetime, pk: int):
+        """Записи строго после (value, pk) в порядке выдачи"""
+        lookup = "lt" if self.descending else "gt"
+        return queryset.filter(
+            Q(**{f"{self.ordering_field}__{lookup}": value})
+            | Q(**{self.ordering_field: value, f"id__{lookup}": pk})
+        )
+
+    def get_row_key(self, row) -> tuple:
+        """(значение поля сортировки, id) для модели или строки QuerySet.values()"""
+        if isinstance(row, dict):
+            return row[self.ordering_field], row["id"]
+        return getattr(row, self.ordering_field), row.pk
+
+    def encode_cursor(self, value: datetime, pk: int) -> str:
+        raw = json.dumps({"c": value.isoformat(), "i": pk}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            return datetime.fromisoformat(data["c"]), int(data["i"])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor:
+            queryset = self.filter_after(queryset, *cursor)
+
+        # Одна лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+        rows = list(queryset.order_by(*self.get_ordering())[:page_size + 1])
+        page = rows[:page_size]
+
+        self.next_cursor = None
+        if len(rows) > page_size:
+            self.next_cursor = self.encode_cursor(*self.get_row_key(page[-1]))
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "next_cursor": self.next_cursor,
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "next_cursor": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+
+class UpdatedSincePagination(KeysetPagination):
+    """Дельта-синхронизация: записи, измененные после курсора, от старых изменений к новым.
+
+    Начало синхронизации задается ?updated_since=<ISO-время>; без него и без курсора
+    ответ пустой и содержит курсор на текущий момент. Курсор возвращается всегда: пока
+    has_more, он указывает точно на последнюю запись, а когда клиент догнал изменения —
+    сдвинут на sync_overlap назад. Так транзакции, которые взяли время раньше, а
+    закоммитились позже, не теряются; повторно пришедшие строки клиент просто заменяет.
+    """
+    ordering_field = "updated_at"
+    descending = False
+    since_query_param = "updated_since"
+    sync_overlap = timedelta(seconds=5)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        settled = timezone.now() - self.sync_overlap
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            raw_since = request.query_params.get(self.since_query_param)
+            if not raw_since:
+                self.has_more = False
+                self.next_cursor = self.encode_cursor(settled, 0)
+                return []
+            since = parse_datetime(raw_since)
+            if since is None:
+                raise ValidationError({self.since_query_param: "Expected ISO 8601 datetime"})
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            cursor = since, 0
+            queryset = self.filter_after(queryset, *cursor)
+
+        page = super().paginate_queryset(queryset, request, view)
+        self.has_more = self.next_cursor is not None
+        if not self.has_more:
+            value, pk = self.get_row_key(page[-1]) if page else cursor
+            if value > settled:
+                value, pk = settled, 0
+            self.next_cursor = self.encode_cursor(value, pk)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next_cursor": self.next_cursor,
+            "has_more": self.has_more,
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["next_cursor", "has_more", "results"],
+            "properties": {
+                "next_cursor": {"type": "string"},
+                "has_more": {"type": "boolean"},
+                "results": schema,
+            },
+        }
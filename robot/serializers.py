@@ -1,3 +1,4 @@
+from django.utils.functional import cached_property
 from rest_framework import serializers
 from .models import Patient
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
@@ -19,11 +20,80 @@ class PatientSerializer(serializers.ModelSerializer):
             'approved_by_doctor',
             'approved_by_accountant',
             'created_at',
+            'updated_at',
+            'archive_status',
+            'archive_error',
+            'archived_at',
         ]
 
 
 
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+# Поля пациента в списках панели; без служебных полей (bot_user, локальный путь к папке, архивирование)
+PATIENT_LIST_FIELDS = (
+    'id',
+    'patient_id',
+    'full_name',
+    'phone_number',
+    'birth_date',
+    'status',
+    'approved_by_doctor',
+    'approved_by_accountant',
+    'rejected_by_doctor',
+    'rejected_by_accountant',
+    'is_fully_approved',
+    'is_rejected',
+    'doctor_comment',
+    'accountant_comment',
+    'drive_folder_url',
+    'created_at',
+    'updated_at',
+)
+
+
+class PatientListSerializer(serializers.ModelSerializer):
+    """Компактное представление пациента для списков, только для чтения.
+
+    Рассчитан на строки QuerySet.values(): модели не создаются, а
+    to_representation собирает словарь напрямую и вызывает поля DRF только для
+    дат. fields= оставляет часть полей из PATIENT_LIST_FIELDS.
+    """
+    class Meta:
+        model = Patient
+        fields = PATIENT_LIST_FIELDS
+        read_only_fields = PATIENT_LIST_FIELDS
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @cached_property
+    def _converters(self) -> list:
+        return [
+            (name, field.to_representation if isinstance(field, (serializers.DateTimeField, serializers.DateField)) else None)
+            for name, field in self.fields.items()
+        ]
+
+    def to_representation(self, row):
+        if not isinstance(row, dict):
+            return super().to_representation(row)
+        data = {}
+        for name, convert in self._converters:
+            value = row[name]
+            data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+
+class BulkDecisionSerializer(serializers.Serializer):
+    """Тело запроса /api/patients/bulk-decision/"""
+    DECISIONS = ("approve", "reject")
+    MAX_IDS = 200
+
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_IDS)
+    decision = serializers.ChoiceField(choices=DECISIONS)
+    comment = serializers.CharField(required=False, allow_blank=True, default="")
+
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
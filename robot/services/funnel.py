@@ -0,0 +1,187 @@
+"""Воронка анкеты по сохраненным переходам состояний (StateTransition)"""
+import atexit
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from ..models import StateTransition
+
+logger = logging.getLogger(__name__)
+
+TRANSITION_COLUMNS = ["id", "telegram_id", "from_state", "to_state", "is_back", "created_at"]
+
+
+def state_name(state) -> str:
+    """Q2_BirthDate из "QuestionnaireStates:Q2_BirthDate", "QuestionnaireStates.Q2_BirthDate" или State"""
+    if state is None:
+        return ""
+    state = getattr(state, "state", state) or ""
+    return re.split(r"[:.]", str(state).rstrip("'>"))[-1]
+
+
+class TransitionRecorder:
+    """Сохраняет переходы в StateTransition пачками из отдельного потока.
+
+    Очередь не ограничена: в отличие от очереди логов переходы не отбрасываются.
+    Пачка пишется одним bulk_create, когда набралось batch_size переходов или
+    прошло flush_interval секунд с первого из них, даже если новых переходов нет.
+    """
+
+    _STOP = object()
+
+    def __init__(self, batch_size: int = None, flush_interval: float = None):
+        self.batch_size = batch_size or settings.STATE_TRANSITION_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.STATE_TRANSITION_FLUSH_INTERVAL
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, row: dict):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="state-transitions", daemon=True)
+                    self._thread.start()
+        self._queue.put(row)
+
+    def stop(self, timeout: float = 10):
+        """Дописывает накопленные переходы и останавливает поток"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+
+    def reset_after_fork(self):
+        # Поток родителя в дочернем процессе не существует, а его переходы сохранит сам родитель
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is self._STOP:
+                return
+            rows = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if row is self._STOP:
+                    stopping = True
+                    break
+                rows.append(row)
+            self._save(rows)
+
+    def _save(self, rows: list):
+        try:
+            close_old_connections()
+            StateTransition.objects.bulk_create([StateTransition(**row) for row in rows])
+        except Exception:
+            logger.exception(f"Failed to save {len(rows)} state transitions")
+
+
+transition_recorder = TransitionRecorder()
+atexit.register(transition_recorder.stop)
+os.register_at_fork(after_in_child=transition_recorder.reset_after_fork)
+
+
+def record_transition(telegram_id, old_state, new_state, back=False):
+    """Сохраняет переход для воронки анкеты, не дожидаясь записи в БД.
+
+    new_state=None — анкета завершена, back=True — возврат кнопкой "Назад".
+    """
+    transition_recorder.record({
+        "telegram_id": telegram_id,
+        "from_state": state_name(old_state),
+        "to_state": state_name(new_state),
+        "is_back": back,
+        "created_at": timezone.now(),
+    })
+
+
+def load_transitions(since=None):
+    """Переходы с момента since в DataFrame (pandas загружается только здесь)"""
+    import pandas as pd
+
+    rows = StateTransition.objects.order_by()
+    if since is not None:
+        rows = rows.filter(created_at__gte=since)
+    return pd.DataFrame.from_records(
+        rows.values_list(*TRANSITION_COLUMNS).iterator(chunk_size=10000), columns=TRANSITION_COLUMNS
+    )
+
+
+def build_funnel(transitions, state_order, now=None, idle=timedelta(hours=24)):
+    """Таблица по шагам анкеты в порядке state_order.
+
+    reached — сколько пользователей дошли до шага; dropped — у скольких он последний
+    (и они неактивны дольше idle), drop_rate = dropped / reached; median_seconds — медиана
+    времени на шаге до следующего перехода; back — нажатия "Назад" на шаге,
+    back_rate — их доля среди всех показов шага. Возвращает (таблица, итоги).
+    """
+    import numpy as np
+    import pandas as pd
+
+    now = now or timezone.now()
+    steps = pd.Index(state_order, name="step")
+    empty = pd.Series(0, index=steps)
+
+    df = transitions.sort_values(["telegram_id", "created_at", "id"], kind="stable").reset_index(drop=True)
+    if df.empty:
+        table = pd.DataFrame({
+            "reached": empty, "dropped": empty, "drop_rate": empty.astype(float),
+            "median_seconds": empty * np.nan, "back": empty, "back_rate": empty.astype(float),
+        })
+        return table, {"users": 0, "started": 0, "completed": 0, "in_progress": 0}
+
+    same_user = df["telegram_id"].eq(df["telegram_id"].shift())
+    # Повтор того же перехода подряд (прежние версии бота писали возврат "Назад" дважды) считаем одним
+    repeated = same_user & df["from_state"].eq(df["from_state"].shift()) & df["to_state"].eq(df["to_state"].shift())
+    df = df[~repeated].reset_index(drop=True)
+    same_user = df["telegram_id"].eq(df["telegram_id"].shift())
+
+    # Время на шаге: от входа в to_state до следующего перехода того же пользователя
+    next_at = df["created_at"].shift(-1).where(same_user.shift(-1, fill_value=False))
+    df["seconds"] = (next_at - df["created_at"]).dt.total_seconds()
+
+    visits = df[df["to_state"].isin(steps)]
+    reached = visits.groupby("to_state")["telegram_id"].nunique().reindex(steps, fill_value=0)
+    shown = visits.groupby("to_state").size().reindex(steps, fill_value=0)
+    median_seconds = visits.groupby("to_state")["seconds"].median().reindex(steps)
+    back = df[df["is_back"]].groupby("from_state").size().reindex(steps, fill_value=0)
+
+    last = df.groupby("telegram_id").tail(1)
+    completed = last["to_state"].eq("")
+    idle_since = now - idle
+    stopped = last[last["to_state"].isin(steps) & (last["created_at"] < idle_since)]
+    dropped = stopped.groupby("to_state").size().reindex(steps, fill_value=0)
+    in_progress = last["to_state"].isin(steps) & (last["created_at"] >= idle_since)
+
+    table = pd.DataFrame({
+        "reached": reached,
+        "dropped": dropped,
+        "drop_rate": (dropped / reached.replace(0, np.nan)).fillna(0.0),
+        "median_seconds": median_seconds,
+        "back": back,
+        "back_rate": (back / shown.replace(0, np.nan)).fillna(0.0),
+    })
+    totals = {
+        "users": int(df["telegram_id"].nunique()),
+        "started": int(reached.iloc[0]),
+        "completed": int(completed.sum()),
+        "in_progress": int(in_progress.sum()),
+    }
+    return table, totals
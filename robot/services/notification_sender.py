@@ -0,0 +1,121 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import NotificationOutbox
+from .notification_service import notification_service
+
+logger = logging.getLogger(__name__)
+
+# Запас к аренде пачки сверх худшего времени отправки всех ее строк
+CLAIM_LEASE_MARGIN_SECONDS = 30
+MAX_RETRY_DELAY_SECONDS = 600
+
+
+class NotificationSender:
+    """Отправляет уведомления из NotificationOutbox, не превышая лимит Telegram"""
+
+    def __init__(self, service=notification_service, rate_limit: int = None, batch_size: int = None, max_attempts: int = None):
+        self.service = service
+        self.rate_limit = rate_limit or settings.NOTIFICATION_RATE_LIMIT
+        self.batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+        self.max_attempts = max_attempts or settings.NOTIFICATION_MAX_ATTEMPTS
+        self._next_send_at = 0.0
+        self._paused_until = 0.0
+
+        # На сколько секунд пачка скрывается от других отправителей после захвата.
+        # Аренда покрывает отправку всей пачки даже при таймауте каждого запроса,
+        # иначе другой процесс sendnotifications заберет те же строки и пациент
+        # получит сообщение дважды. Если процесс упадет посреди пачки,
+        # неотправленные строки вернутся в очередь по истечении аренды
+        per_row = settings.NOTIFICATION_REQUEST_TIMEOUT + 1 / self.rate_limit
+        self.claim_lease = self.batch_size * per_row + CLAIM_LEASE_MARGIN_SECONDS
+
+    def claim_batch(self) -> list:
+        """Забирает пачку готовых к отправке строк"""
+        now = timezone.now()
+        with transaction.atomic():
+            rows = list(
+                NotificationOutbox.objects
+                .select_for_update(skip_locked=True)
+                .filter(status="pending", next_attempt_at__lte=now)
+                .order_by("next_attempt_at", "id")[:self.batch_size]
+            )
+            if rows:
+                NotificationOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+                    next_attempt_at=now + timedelta(seconds=self.claim_lease)
+                )
+        return rows
+
+    def _wait_for_slot(self):
+        """Равномерно распределяет отправку: не больше rate_limit сообщений в секунду"""
+        wait = max(self._next_send_at, self._paused_until) - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._next_send_at = time.monotonic() + 1 / self.rate_limit
+
+    def _release(self, rows: list, delay: int):
+        NotificationOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+            next_attempt_at=timezone.now() + timedelta(seconds=delay)
+        )
+
+    def send(self, row: NotificationOutbox) -> str:
+        """Отправляет одну строку очереди и возвращает итог: sent, retry, throttled или failed"""
+        self._wait_for_slot()
+        result = self.service.deliver(row.chat_id, row.text, row.parse_mode)
+        now = timezone.now()
+        queryset = NotificationOutbox.objects.filter(pk=row.pk)
+
+        if result.ok:
+            queryset.update(status="sent", sent_at=now, attempts=row.attempts + 1, last_error=None)
+            return "sent"
+
+        if result.retry_after is not None:
+            # 429: Telegram просит подождать всех, попытка не засчитывается
+            self._paused_until = time.monotonic() + result.retry_after
+            queryset.update(next_attempt_at=now + timedelta(seconds=result.retry_after), last_error=result.error)
+            logger.warning(f"Telegram flood limit, пауза {result.retry_after} с")
+            return "throttled"
+
+        attempts = row.attempts + 1
+        if result.permanent or attempts >= self.max_attempts:
+            queryset.update(status="failed", attempts=attempts, last_error=result.error)
+            logger.error(f"Уведомление {row.pk} для {row.chat_id} не отправлено: {result.error}")
+            return "failed"
+
+        delay = min(2 ** attempts, MAX_RETRY_DELAY_SECONDS)
+        queryset.update(attempts=attempts, last_error=result.error, next_attempt_at=now + timedelta(seconds=delay))
+        return "retry"
+
+    def drain(self) -> dict:
+        """Отправляет все готовые уведомления и возвращает счетчики по итогам"""
+        stats = {"sent": 0, "retry": 0, "throttled": 0, "failed": 0}
+        while True:
+            # Пауза после 429 выжидается до захвата, чтобы не тратить на нее аренду пачки
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+
+            rows = self.claim_batch()
+            if not rows:
+                return stats
+
+            for index, row in enumerate(rows):
+                outcome = self.send(row)
+                stats[outcome] += 1
+                if outcome == "throttled":
+                    # Остаток пачки возвращаем в очередь к концу паузы, а не по истечении аренды
+                    self._release(rows[index + 1:], int(self._paused_until - time.monotonic()) + 1)
+                    break
+
+    def run(self, poll_interval: float = None):
+        poll_interval = poll_interval or settings.NOTIFICATION_POLL_INTERVAL
+        while True:
+            stats = self.drain()
+            if any(stats.values()):
+                logger.info(f"Отправка уведомлений: {stats}")
+            time.sleep(poll_interval)
@@ -1,37 +1,85 @@
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
-from ..models import Patient
+from ..models import Patient, NotificationOutbox
 
 logger = logging.getLogger(__name__)
 
+class SendResult:
+    """Результат одной попытки отправки сообщения в Telegram"""
+
+    def __init__(self, ok: bool, error: str = None, retry_after: int = None, permanent: bool = False):
+        self.ok = ok
+        self.error = error
+        self.retry_after = retry_after  # секунды из ответа 429 Too Many Requests
+        self.permanent = permanent  # повтор бессмысленен (бот заблокирован, чат не найден)
+
 class NotificationService:
     def __init__(self):
         self.bot_token = settings.BOT_TOKEN
         self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
-    
+        self._session = None
+
+    @property
+    def session(self) -> requests.Session:
+        """Общая HTTP-сессия: keep-alive соединения с api.telegram.org переиспользуются"""
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.NOTIFICATION_POOL_SIZE)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def deliver(self, chat_id, text: str, parse_mode: str = "HTML") -> SendResult:
+        """Одна попытка отправки сообщения с разбором ответа Telegram"""
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": parse_mode
+        }
+        try:
+            response = self.session.post(f"{self.base_url}/sendMessage", json=payload, timeout=settings.NOTIFICATION_REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            return SendResult(ok=False, error=str(e))
+
+        if response.status_code == 200:
+            return SendResult(ok=True)
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        error = body.get("description") or response.text
+
+        if response.status_code == 429:
+            retry_after = body.get("parameters", {}).get("retry_after", 1)
+            return SendResult(ok=False, error=error, retry_after=int(retry_after))
+
+        # 400/403: неверный chat_id, бот заблокирован пользователем и т.п.
+        return SendResult(ok=False, error=error, permanent=400 <= response.status_code < 500)
+
     def send_message(self, chat_id: str, text: str, parse_mode: str = "HTML"):
         """Отправка сообщения в Telegram"""
-        try:
-            url = f"{self.base_url}/sendMessage"
-            payload = {
-                "chat_id": chat_id,
-                "text": text,
-                "parse_mode": parse_mode
-            }
-            
-            response = requests.post(url, json=payload, timeout=10)
-            
-            if response.status_code == 200:
-                logger.info(f"Сообщение успешно отправлено пациенту {chat_id}")
-                return True
-            else:
-                logger.error(f"Ошибка отправки сообщения: {response.text}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Ошибка при отправке сообщения: {str(e)}")
-            return False
+        result = self.deliver(chat_id, text, parse_mode)
+        if result.ok:
+            logger.info(f"Сообщение успешно отправлено пациенту {chat_id}")
+        else:
+            logger.error(f"Ошибка отправки сообщения: {result.error}")
+        return result.ok
+
+    def enqueue_patient_status_change(self, patient: Patient, previous_status: str = None):
+        """Ставит уведомление об изменении статуса в очередь NotificationOutbox"""
+
+        if not patient.bot_user or not patient.bot_user.telegram_id:
+            logger.warning(f"У пациента {patient.patient_id} нет telegram_id")
+            return None
+
+        return NotificationOutbox.objects.create(
+            patient=patient,
+            chat_id=patient.bot_user.telegram_id,
+            text=self._build_status_message(patient, previous_status),
+        )
     
     def notify_patient_status_change(self, patient: Patient, previous_status: str = None):
         """Уведомление пациента об изменении статуса"""
@@ -47,6 +95,27 @@ class NotificationService:
             text=message
         )
     
+    def enqueue_status_changes(self, changes: list):
+        """Ставит в очередь уведомления по списку (pk, прежний статус, новый статус) одним INSERT"""
+        previous = {
+            pk: previous_status for pk, previous_status, new_status in changes
+            if previous_status != new_status and new_status != "waiting"
+        }
+        if not previous:
+            return []
+
+        notifications = []
+        for patient in Patient.objects.filter(pk__in=previous).select_related("bot_user"):
+            if not patient.bot_user or not patient.bot_user.telegram_id:
+                logger.warning(f"У пациента {patient.patient_id} нет telegram_id")
+                continue
+            notifications.append(NotificationOutbox(
+                patient=patient,
+                chat_id=patient.bot_user.telegram_id,
+                text=self._build_status_message(patient, previous[patient.pk]),
+            ))
+        return NotificationOutbox.objects.bulk_create(notifications)
+    
     def _build_status_message(self, patient: Patient, previous_status: str = None):
         """Формирование сообщения в зависимости от статуса"""
         
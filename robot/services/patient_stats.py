@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from ..models import Patient
+
+STATS_CACHE_KEY = "patients:stats"
+
+# Анкета считается просроченной, если ждет решения дольше 3 рабочих дней
+LATE_AFTER_WORKING_DAYS = 3
+PENDING_STATUSES = ("waiting", "approved_by_doctor", "approved_by_accountant")
+
+
+def working_days_ago(now, days: int):
+    """Момент на days рабочих дней (пн–пт) раньше now"""
+    moment = timezone.localtime(now)
+    while days > 0:
+        moment -= timedelta(days=1)
+        if moment.weekday() < 5:
+            days -= 1
+    return moment
+
+
+def compute_patient_stats(now=None) -> dict:
+    """Счетчики для панели управления одним запросом GROUP BY status"""
+    now = now or timezone.now()
+    late_cutoff = working_days_ago(now, LATE_AFTER_WORKING_DAYS)
+
+    rows = (
+        Patient.objects
+        .order_by()
+        .values("status")
+        .annotate(total=Count("id"), late=Count("id", filter=Q(created_at__lt=late_cutoff)))
+    )
+    by_status = {row["status"]: row for row in rows}
+
+    def total(*statuses):
+        return sum(by_status.get(status, {}).get("total", 0) for status in statuses)
+
+    return {
+        "total": sum(row["total"] for row in by_status.values()),
+        "approved": total("fully_approved"),
+        "rejected": total("rejected"),
+        "pending": total(*PENDING_STATUSES),
+        "late": sum(by_status.get(status, {}).get("late", 0) for status in PENDING_STATUSES),
+        "by_status": {status: row["total"] for status, row in by_status.items()},
+        "generated_at": now.isoformat(),
+    }
+
+
+def get_patient_stats() -> dict:
+    return cache.get_or_set(STATS_CACHE_KEY, compute_patient_stats, settings.PATIENT_STATS_CACHE_TTL)
+
+
+def invalidate_patient_stats():
+    cache.delete(STATS_CACHE_KEY)
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import BotUser, RegistrationQuota
+
+
+def reserve_registration(day=None, limit=None) -> bool:
+    """Занимает место в дневном лимите регистраций.
+
+    Проверка и увеличение счетчика выполняются одним условным UPDATE,
+    поэтому одновременные регистрации не могут превысить лимит.
+    """
+    day = day or timezone.localdate()
+    limit = settings.DAILY_REGISTRATION_LIMIT if limit is None else limit
+
+    quota = RegistrationQuota.objects.filter(day=day, used__lt=limit)
+    if quota.update(used=F("used") + 1):
+        return True
+
+    # Строки на этот день еще нет (первая регистрация за день) — создаем и пробуем снова
+    RegistrationQuota.objects.get_or_create(day=day)
+    return quota.update(used=F("used") + 1) == 1
+
+
+def create_bot_user_within_quota(**fields):
+    """Создает BotUser, если дневной лимит не исчерпан; иначе возвращает None.
+
+    Резерв и создание идут в одной транзакции: при ошибке создания место в лимите откатывается.
+    """
+    with transaction.atomic():
+        if not reserve_registration():
+            return None
+        return BotUser.objects.create(**fields)
@@ -1,48 +1,66 @@
-from django.db.models.signals import post_save, pre_save
-from django.dispatch import receiver
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
 from .models import Patient
 from .services.notification_service import notification_service
+from .services.patient_stats import invalidate_patient_stats
 import logging
 
 logger = logging.getLogger(__name__)
 
-@receiver(pre_save, sender=Patient)
-def store_previous_status(sender, instance, **kwargs):
-    """Сохраняем предыдущий статус перед сохранением"""
-    if instance.pk:
-        try:
-            previous = Patient.objects.get(pk=instance.pk)
-            instance._previous_status = previous.status
-        except Patient.DoesNotExist:
-            instance._previous_status = None
-    else:
-        instance._previous_status = None
+# Отправляется PatientQuerySet.apply_decision внутри транзакции.
+# changes: список (pk, прежний статус, новый статус); role; approve
+patient_status_changed = Signal()
+
+@receiver(patient_status_changed)
+def enqueue_decision_notifications(sender, changes, role, approve, **kwargs):
+    """Ставим уведомления в очередь в той же транзакции, что и решение"""
+    for pk, previous_status, new_status in changes:
+        if previous_status != new_status:
+            logger.info(f"Пациент {pk}: статус изменился с '{previous_status}' на '{new_status}' ({role})")
+    notification_service.enqueue_status_changes(changes)
 
 @receiver(post_save, sender=Patient)
 def notify_patient_status_change(sender, instance, created, **kwargs):
-    """Отправляем уведомление при изменении статуса"""
+    """Ставим уведомление в очередь при изменении статуса"""
     
     if created:
         return
     
-    previous_status = getattr(instance, '_previous_status', None)
+    previous_status = instance.get_original_value('status')
     current_status = instance.status
     
     if previous_status != current_status and current_status != "waiting":
-        logger.info(f"Отправка уведомления пациенту {instance.patient_id}: {previous_status} -> {current_status}")
+        logger.info(f"Уведомление пациенту {instance.patient_id} поставлено в очередь: {previous_status} -> {current_status}")
         
+        # Отправкой занимается python manage.py sendnotifications, запрос не ждет Telegram
         try:
-            notification_service.notify_patient_status_change(
+            notification_service.enqueue_patient_status_change(
                 patient=instance,
                 previous_status=previous_status
             )
         except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления пациенту {instance.patient_id}: {str(e)}")
+            logger.error(f"Ошибка при постановке уведомления пациенту {instance.patient_id} в очередь: {str(e)}")
 
 @receiver(post_save, sender=Patient)
 def log_patient_status_change(sender, instance, created, **kwargs):
     """Логируем изменения статуса пациента"""
     if not created:
-        previous_status = getattr(instance, '_previous_status', None)
+        previous_status = instance.get_original_value('status')
         if previous_status != instance.status:
-            logger.info(f"Пациент {instance.patient_id} ({instance.full_name}): статус изменился с '{previous_status}' на '{instance.status}'")
\ No newline at end of file
+            logger.info(f"Пациент {instance.patient_id} ({instance.full_name}): статус изменился с '{previous_status}' на '{instance.status}'")
+
+@receiver(patient_status_changed)
+def invalidate_stats_on_decision(sender, changes, **kwargs):
+    if any(previous_status != new_status for _, previous_status, new_status in changes):
+        # После коммита, иначе параллельный запрос успеет закешировать старые значения
+        transaction.on_commit(invalidate_patient_stats)
+
+@receiver(post_save, sender=Patient)
+def invalidate_stats_on_save(sender, instance, created, **kwargs):
+    if created or instance.get_original_value('status') != instance.status:
+        transaction.on_commit(invalidate_patient_stats)
+
+@receiver(post_delete, sender=Patient)
+def invalidate_stats_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_patient_stats)
@@ -0,0 +1,68 @@
+import asyncio
+
+from aiogram import Bot
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from robot.models import Patient
+from robot.utils.google_drive.storage import DRIVE_FOLDER_URL, save_questionnaire
+from robot.utils.misc.logging import log_user_action, log_error
+
+
+async def _archive_questionnaire(user_data: dict, user_id: int = None, drive_folder_id: str = None) -> tuple:
+    bot = Bot(token=settings.BOT_TOKEN)
+    try:
+        return await save_questionnaire(user_data, bot, user_id=user_id, drive_folder_id=drive_folder_id)
+    finally:
+        await bot.session.close()
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    max_retries=5,
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True,
+)
+def archive_questionnaire(self, patient_pk: int, user_data: dict, user_id: int = None) -> str:
+    """Скачивает вложения анкеты и сохраняет её вместе с Excel-файлом в хранилище QUESTIONNAIRE_STORAGE"""
+    Patient.objects.filter(pk=patient_pk).update(archive_status="processing", updated_at=timezone.now())
+
+    # Повторная отправка анкеты пациента использует уже созданную папку на Drive
+    folder_id, folder_url = Patient.objects.filter(pk=patient_pk).values_list("folder_id", "drive_folder_url").first() or (None, None)
+    drive_folder_id = folder_id if folder_url and folder_url.startswith(DRIVE_FOLDER_URL.format("")) else None
+
+    try:
+        folder_id, folder_url = asyncio.run(_archive_questionnaire(user_data, user_id, drive_folder_id))
+    except Exception as e:
+        is_last_attempt = self.request.retries >= self.max_retries
+        Patient.objects.filter(pk=patient_pk).update(
+            archive_status="failed" if is_last_attempt else "retrying",
+            archive_error=str(e),
+            updated_at=timezone.now(),
+        )
+        log_error(
+            user_id=user_id,
+            error=e,
+            context=f"Archiving questionnaire, attempt {self.request.retries + 1}",
+            state="archive_questionnaire",
+        )
+        raise
+
+    Patient.objects.filter(pk=patient_pk).update(
+        archive_status="done",
+        archive_error=None,
+        archived_at=timezone.now(),
+        folder_id=folder_id,
+        drive_folder_url=folder_url,
+        updated_at=timezone.now(),
+    )
+    log_user_action(
+        user_id=user_id,
+        action="Questionnaire archived",
+        state="archive_questionnaire",
+        extra_data=f"Folder: {folder_url}"
+    )
+    return folder_id
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views.patient_views import PatientListView, ApprovePatientView, RejectPatientView, SendNotificationView
+from .views.patient_views import PatientListView, PatientChangesView, PatientStatsView, ApprovePatientView, RejectPatientView, BulkDecisionView, SendNotificationView
 from .views.auth_views import CustomLoginView
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -7,6 +7,9 @@ urlpatterns = [
     path('token/', CustomLoginView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('patients/', PatientListView.as_view(), name='patient-list'),
+    path('patients/changes/', PatientChangesView.as_view(), name='patient-changes'),
+    path('patients/stats/', PatientStatsView.as_view(), name='patient-stats'),
+    path('patients/bulk-decision/', BulkDecisionView.as_view(), name='patient-bulk-decision'),
     path('patients/<int:pk>/approve/', ApprovePatientView.as_view(), name='patient-approve'),
     path("patients/<int:pk>/reject/", RejectPatientView.as_view(), name="reject-patient"),
     path('patients/<int:pk>/notify/', SendNotificationView.as_view(), name='send-notification'),
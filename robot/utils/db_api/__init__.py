@@ -0,0 +1 @@
+from .calls import db_call
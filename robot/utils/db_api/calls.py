@@ -0,0 +1,36 @@
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+
+from robot.utils.misc.logging import log_event
+from robot.utils.misc.metrics import DB_CALL_SECONDS
+
+
+def _operation_name(func) -> str:
+    """Имя операции для метрик: Patient.first, BotUser.get, Patient.save, create_bot_user_within_quota"""
+    owner = getattr(func, "__self__", None)
+    model = getattr(owner, "model", None) or (type(owner) if hasattr(owner, "_meta") else None)
+    if model is not None:
+        return f"{model.__name__}.{func.__name__}"
+    return getattr(func, "__qualname__", repr(func))
+
+
+async def db_call(func, *args, operation: str = None, **kwargs):
+    """sync_to_async(func)(*args, **kwargs) с замером времени.
+
+    Длительность попадает в гистограмму sabo_db_call_duration_seconds и в событие db_call.
+    """
+    operation = operation or _operation_name(func)
+    status = "ok"
+    started = time.perf_counter()
+    try:
+        return await sync_to_async(func)(*args, **kwargs)
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        DB_CALL_SECONDS.observe(duration, operation=operation, status=status)
+        log_event("db_call", level=logging.DEBUG, operation=operation, status=status,
+                  duration_ms=round(duration * 1000, 2))
@@ -0,0 +1,39 @@
+import json
+import functools
+
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from django.conf import settings
+
+
+# Компактная сериализация данных анкеты: без пробелов и без \uXXXX для кириллицы
+compact_json_dumps = functools.partial(json.dumps, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_fsm_storage(backend: str = None) -> BaseStorage:
+    """Создает хранилище FSM согласно settings.FSM_STORAGE ("redis" или "memory")"""
+    backend = (backend or settings.FSM_STORAGE).lower()
+
+    if backend == "memory":
+        # Локальное хранилище для тестов и разработки, данные живут только в памяти процесса
+        return MemoryStorage()
+
+    if backend == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        return RedisStorage.from_url(
+            settings.REDIS_URL,
+            key_builder=DefaultKeyBuilder(prefix="sabo_fsm", with_bot_id=True),
+            state_ttl=settings.FSM_STATE_TTL,
+            data_ttl=settings.FSM_DATA_TTL,
+            json_dumps=compact_json_dumps,
+        )
+
+    raise ValueError(f"❌ Unknown FSM storage backend: {backend}")
+
+
+def build_events_isolation(storage: BaseStorage):
+    """Блокировки по пользователю, общие для всех воркеров при Redis-хранилище"""
+    if hasattr(storage, "create_isolation"):
+        return storage.create_isolation()
+    return None
@@ -1 +1,22 @@
-from .google_drive import save_full_questionnaire_to_drive, create_folder, PARENT_FOLDER_ID
+import importlib
+
+# googleapiclient и google-auth загружаются только при первом обращении к Drive,
+# чтобы бот и management-команды не платили за их импорт при локальном хранилище
+_LAZY_ATTRS = {
+    "save_full_questionnaire_to_drive": ".google_drive",
+    "create_folder": ".google_drive",
+    "PARENT_FOLDER_ID": ".google_drive",
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRS))
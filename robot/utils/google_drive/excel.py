@@ -0,0 +1,112 @@
+import io
+import asyncio
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Side, PatternFill, Font
+
+EXCEL_SHEET_TITLE = "Анкета"
+EXCEL_HEADERS = ("Вопрос", "Ответ")
+EXCEL_COLUMN_WIDTHS = {"A": 45, "B": 65}
+EXCEL_ROW_HEIGHT = 25
+
+# Стили создаются один раз на процесс и переиспользуются для каждой анкеты
+_thin_side = Side(style='thin', color='000000')
+THIN_BORDER = Border(left=_thin_side, right=_thin_side, top=_thin_side, bottom=_thin_side)
+
+HEADER_STYLE = {
+    "fill": PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid"),  # Синий фон для заголовков
+    "font": Font(color="FFFFFF", bold=True, size=12),  # Белый жирный текст
+    "alignment": Alignment(wrap_text=True, vertical='center', horizontal='center'),
+}
+QUESTION_STYLE = {
+    "fill": PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid"),  # Светло-серый для вопросов
+    "font": Font(bold=True, size=11),
+    "alignment": Alignment(wrap_text=True, vertical='top', horizontal='left'),
+}
+ANSWER_STYLE = {
+    "fill": PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid"),  # Белый для ответов
+    "font": Font(size=11),
+    "alignment": Alignment(wrap_text=True, vertical='top', horizontal='left'),
+}
+
+
+def build_questionnaire_rows(user_data: dict, labels: dict, file_keys: dict) -> list:
+    """Готовит строки (вопрос, ответ) для таблицы анкеты"""
+    rows = []
+
+    # Добавляем ФИО первым
+    full_name = user_data.get('q1_full_name', '')
+    if full_name:
+        rows.append(("ФИО", full_name))
+
+    # Обрабатываем остальные вопросы
+    for key, value in user_data.items():
+        if key == "q1_full_name" or key == "full_name":
+            continue
+
+        label = labels.get(key, key)
+
+        if key in file_keys:
+            # Для файлов показываем статус наличия
+            if isinstance(value, list):
+                answer = f"{len(value)} файл(ов) ✅" if value else "—"
+            else:
+                answer = "Есть файл ✅" if value else "—"
+        else:
+            # Для обычных ответов
+            answer = str(value) if value is not None else "—"
+
+        rows.append((label, answer))
+
+    return rows
+
+
+def _styled_cell(worksheet, value, style: dict) -> WriteOnlyCell:
+    cell = WriteOnlyCell(worksheet, value=value)
+    cell.fill = style["fill"]
+    cell.font = style["font"]
+    cell.alignment = style["alignment"]
+    cell.border = THIN_BORDER
+    return cell
+
+
+def write_questionnaire_excel(rows: list, destination) -> None:
+    """Записывает анкету в Excel в потоковом (write-only) режиме openpyxl.
+
+    destination — путь к файлу или файловый объект.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(EXCEL_SHEET_TITLE)
+
+    for column, width in EXCEL_COLUMN_WIDTHS.items():
+        worksheet.column_dimensions[column].width = width
+
+    # В write-only режиме размеры строк задаются до записи самих строк
+    for row in range(1, len(rows) + 2):
+        worksheet.row_dimensions[row].height = EXCEL_ROW_HEIGHT
+
+    worksheet.append([_styled_cell(worksheet, header, HEADER_STYLE) for header in EXCEL_HEADERS])
+    for question, answer in rows:
+        worksheet.append([
+            _styled_cell(worksheet, question, QUESTION_STYLE),
+            _styled_cell(worksheet, answer, ANSWER_STYLE),
+        ])
+
+    workbook.save(destination)
+
+
+def render_questionnaire_excel(rows: list) -> bytes:
+    """Создает Excel файл анкеты в памяти и возвращает байты"""
+    buffer = io.BytesIO()
+    write_questionnaire_excel(rows, buffer)
+    return buffer.getvalue()
+
+
+async def write_questionnaire_excel_async(rows: list, destination) -> None:
+    """Запись Excel в отдельном потоке, чтобы не блокировать event loop"""
+    await asyncio.to_thread(write_questionnaire_excel, rows, destination)
+
+
+async def render_questionnaire_excel_async(rows: list) -> bytes:
+    return await asyncio.to_thread(render_questionnaire_excel, rows)
@@ -1,13 +1,22 @@
 import os
 import io
+import asyncio
+import functools
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
+import google_auth_httplib2
 from dotenv import load_dotenv
 from google.oauth2.service_account import Credentials as ServiceAccountCredentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 from aiogram import Bot
 from googleapiclient.errors import HttpError
-import pandas as pd
-from robot.utils.misc.logging import log_handler, log_user_action, log_state_change, log_error, log_file_operation
+from robot.utils.google_drive.excel import build_questionnaire_rows, render_questionnaire_excel, render_questionnaire_excel_async
+from robot.utils.google_drive.telegram_files import observe_file_transfer, stream_telegram_file
+from robot.utils.misc.logging import logger, log_handler, log_user_action, log_state_change, log_error, log_file_operation
 
 load_dotenv(dotenv_path=".env", override=True)
 
@@ -15,6 +24,15 @@ SCOPES = ['https://www.googleapis.com/auth/drive.file']
 SERVICE_ACCOUNT_PATH = os.getenv('GOOGLE_DRIVE_SERVICE_ACCOUNT_PATH')
 PARENT_FOLDER_ID = os.getenv("GOOGLE_DRIVE_PARENT_FOLDER_ID")
 
+# Размер части при возобновляемой загрузке на Drive (кратен 256 КБ)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Загрузки на Drive блокирующие, поэтому выполняются в пуле потоков вне event loop
+DRIVE_UPLOAD_WORKERS = 4
+# Сколько вложений одновременно скачивается из Telegram и лежит во временных файлах
+DRIVE_TRANSFER_CONCURRENCY = DRIVE_UPLOAD_WORKERS
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
 QUESTION_LABELS = {
     "q1_full_name": "ФИО",
     "q2_birth_date": "Дата рождения",
@@ -57,137 +75,145 @@ QUESTION_FILE_KEYS = {
     "q24_additional_file": "📎 Дополнительный файл",
 }
 
+# Клиент Drive создается один раз на процесс; httplib2 не потокобезопасен,
+# поэтому у каждого потока свой транспорт с общими учетными данными
+_client_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_thread_local = threading.local()
+_credentials = None
+_service = None
+
+DRIVE_CLIENT_STATS = {"builds": 0, "refreshes": 0}
+
+class SharedServiceAccountCredentials(ServiceAccountCredentials):
+    """Учетные данные, общие для транспортов всех потоков.
+
+    AuthorizedHttp каждого потока обновляет токен сам (по истечении или после 401),
+    поэтому обновление идет под общей блокировкой: поток, дождавшийся блокировки,
+    использует токен, уже полученный другим потоком. Каждое обновление
+    учитывается в DRIVE_CLIENT_STATS["refreshes"].
+    """
+
+    def refresh(self, request):
+        token = self.token
+        with _refresh_lock:
+            if self.token != token and self.valid:
+                return
+            super().refresh(request)
+            DRIVE_CLIENT_STATS["refreshes"] += 1
+
+def get_drive_credentials():
+    """Общие учетные данные сервисного аккаунта, токен обновляется только по истечении"""
+    global _credentials
+    with _client_lock:
+        if _credentials is None:
+            if not SERVICE_ACCOUNT_PATH:
+                raise ValueError("❌ GOOGLE_DRIVE_SERVICE_ACCOUNT_PATH not set in .env file")
+
+            if not os.path.exists(SERVICE_ACCOUNT_PATH):
+                raise FileNotFoundError(f"❌ Service account file not found: {SERVICE_ACCOUNT_PATH}")
+
+            _credentials = SharedServiceAccountCredentials.from_service_account_file(SERVICE_ACCOUNT_PATH, scopes=SCOPES)
+
+        if not _credentials.valid:
+            _credentials.refresh(google_auth_httplib2.Request(httplib2.Http()))
+
+        return _credentials
+
+def get_drive_http():
+    """Авторизованный транспорт текущего потока"""
+    credentials = get_drive_credentials()
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+        _thread_local.http = http
+    return http
+
 def get_drive_service():
-    if not SERVICE_ACCOUNT_PATH:
-        raise ValueError("❌ GOOGLE_DRIVE_SERVICE_ACCOUNT_PATH not set in .env file")
-    
-    if not os.path.exists(SERVICE_ACCOUNT_PATH):
-        raise FileNotFoundError(f"❌ Service account file not found: {SERVICE_ACCOUNT_PATH}")
-    
-    creds = ServiceAccountCredentials.from_service_account_file(SERVICE_ACCOUNT_PATH, scopes=SCOPES)
-    return build('drive', 'v3', credentials=creds)
+    """Клиент Drive API, общий для всего процесса. Запросы выполняйте с http=get_drive_http()"""
+    global _service
+    if _service is None:
+        http = get_drive_http()
+        with _client_lock:
+            if _service is None:
+                _service = build('drive', 'v3', http=http, cache_discovery=False)
+                DRIVE_CLIENT_STATS["builds"] += 1
+    return _service
+
+def get_drive_client_stats() -> dict:
+    return dict(DRIVE_CLIENT_STATS)
+
+def reset_drive_client():
+    """Сбрасывает закешированный клиент (например, после смены сервисного аккаунта)"""
+    global _credentials, _service, _thread_local
+    with _client_lock:
+        _credentials = None
+        _service = None
+        _thread_local = threading.local()
+
+_upload_executor = ThreadPoolExecutor(max_workers=DRIVE_UPLOAD_WORKERS, thread_name_prefix="drive-upload")
+
+async def run_in_drive_executor(func, *args, **kwargs):
+    """Выполняет блокирующий вызов Drive API в пуле потоков, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_upload_executor, functools.partial(func, *args, **kwargs))
 
 def create_folder(name: str, parent_id: str = None) -> str:
     service = get_drive_service()
-    metadata = {'name': name, 'mimeType': 'application/vnd.google-apps.folder'}
+    metadata = {'name': name, 'mimeType': FOLDER_MIME_TYPE}
     if parent_id:
         metadata['parents'] = [parent_id]
-    folder = service.files().create(body=metadata, fields='id').execute()
+    folder = service.files().create(body=metadata, fields='id').execute(http=get_drive_http())
     return folder['id']
 
+def create_folders_batch(names: dict, parent_id: str) -> dict:
+    """Создает несколько папок одним batch-запросом.
+
+    Принимает {ключ: имя папки} и возвращает {ключ: id папки}. Если хотя бы
+    одна папка не создалась, выбрасывается первая полученная ошибка.
+    """
+    if not names:
+        return {}
+
+    service = get_drive_service()
+    created = {}
+    errors = []
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors.append(exception)
+        else:
+            created[request_id] = response['id']
+
+    batch = service.new_batch_http_request(callback=callback)
+    for key, name in names.items():
+        metadata = {'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent_id]}
+        batch.add(service.files().create(body=metadata, fields='id'), request_id=key)
+    batch.execute(http=get_drive_http())
+
+    if errors:
+        raise errors[0]
+    return created
+
 def upload_file_to_folder(file_bytes: bytes, filename: str, mime_type: str, folder_id: str) -> str:
+    return upload_stream_to_folder(io.BytesIO(file_bytes), filename, mime_type, folder_id)
+
+def upload_stream_to_folder(stream, filename: str, mime_type: str, folder_id: str) -> str:
+    """Возобновляемая загрузка по частям: в памяти одновременно не больше UPLOAD_CHUNK_SIZE байт"""
     service = get_drive_service()
     metadata = {'name': filename, 'parents': [folder_id]}
-    media = MediaIoBaseUpload(io.BytesIO(file_bytes), mimetype=mime_type)
-    uploaded_file = service.files().create(body=metadata, media_body=media, fields='id').execute()
-    return uploaded_file['id']
+    media = MediaIoBaseUpload(stream, mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    request = service.files().create(body=metadata, media_body=media, fields='id')
+
+    response = None
+    while response is None:
+        _, response = request.next_chunk(http=get_drive_http())
+    return response['id']
 
 def create_questionnaire_excel_bytes(user_data: dict) -> bytes:
     """Создает Excel файл анкеты в памяти и возвращает байты"""
     try:
-        # Подготавливаем данные для таблицы
-        questions = []
-        answers = []
-        
-        # Добавляем ФИО первым
-        full_name = user_data.get('q1_full_name', '')
-        if full_name:
-            questions.append("ФИО")
-            answers.append(full_name)
-
-        # Обрабатываем остальные вопросы
-        for key, value in user_data.items():
-            if key == "q1_full_name" or key == "full_name":
-                continue
-                
-            label = QUESTION_LABELS.get(key, key)
-
-            if key in QUESTION_FILE_KEYS:
-                # Для файлов показываем статус наличия
-                if isinstance(value, list):
-                    answer = f"{len(value)} файл(ов) ✅" if value else "—"
-                else:
-                    answer = "Есть файл ✅" if value else "—"
-            else:
-                # Для обычных ответов
-                answer = str(value) if value is not None else "—"
-            
-            questions.append(label)
-            answers.append(answer)
-
-        # Создаем DataFrame
-        df = pd.DataFrame({
-            'Вопрос': questions,
-            'Ответ': answers
-        })
-
-        # Создаем Excel в памяти
-        excel_buffer = io.BytesIO()
-        
-        # Создаем Excel writer с настройками
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Анкета', index=False)
-            
-            # Получаем worksheet для настройки форматирования
-            worksheet = writer.sheets['Анкета']
-            
-            # Настраиваем ширину столбцов
-            worksheet.column_dimensions['A'].width = 45  # Столбец "Вопрос"
-            worksheet.column_dimensions['B'].width = 65  # Столбец "Ответ"
-            
-            # Импортируем стили для форматирования
-            from openpyxl.styles import Alignment, Border, Side, PatternFill, Font
-            
-            # Определяем стили
-            header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")  # Синий фон для заголовков
-            header_font = Font(color="FFFFFF", bold=True, size=12)  # Белый жирный текст
-            
-            question_fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")  # Светло-серый для вопросов
-            question_font = Font(bold=True, size=11)  # Жирный текст для вопросов
-            
-            answer_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")  # Белый для ответов
-            answer_font = Font(size=11)  # Обычный текст для ответов
-            
-            # Создаем границы
-            thin_border = Border(
-                left=Side(style='thin', color='000000'),
-                right=Side(style='thin', color='000000'),
-                top=Side(style='thin', color='000000'),
-                bottom=Side(style='thin', color='000000')
-            )
-            
-            # Форматируем заголовки (первая строка)
-            for col in range(1, 3):  # Столбцы A и B
-                cell = worksheet.cell(row=1, column=col)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.border = thin_border
-                cell.alignment = Alignment(wrap_text=True, vertical='center', horizontal='center')
-            
-            # Форматируем остальные строки
-            for row in range(2, len(df) + 2):  # Начинаем со второй строки
-                # Столбец A (Вопросы) - серый фон
-                question_cell = worksheet.cell(row=row, column=1)
-                question_cell.fill = question_fill
-                question_cell.font = question_font
-                question_cell.border = thin_border
-                question_cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
-                
-                # Столбец B (Ответы) - белый фон
-                answer_cell = worksheet.cell(row=row, column=2)
-                answer_cell.fill = answer_fill
-                answer_cell.font = answer_font
-                answer_cell.border = thin_border
-                answer_cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
-            
-            # Устанавливаем высоту строк для лучшего отображения
-            for row in range(1, len(df) + 2):
-                worksheet.row_dimensions[row].height = 25
-
-        # Получаем байты
-        excel_buffer.seek(0)
-        return excel_buffer.read()
-
+        return render_questionnaire_excel(build_questionnaire_rows(user_data, QUESTION_LABELS, QUESTION_FILE_KEYS))
     except Exception as e:
         print(f"❌ Ошибка при создании Excel: {e}")
         raise
@@ -203,7 +229,7 @@ def upload_excel_to_drive(excel_bytes: bytes, filename: str, folder_id: str) ->
         io.BytesIO(excel_bytes), 
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
-    uploaded_file = service.files().create(body=metadata, media_body=media, fields='id').execute()
+    uploaded_file = service.files().create(body=metadata, media_body=media, fields='id').execute(http=get_drive_http())
     return uploaded_file['id']
 
 def upload_text_to_drive(content: str, filename: str, folder_id: str = None) -> str:
@@ -213,14 +239,13 @@ def upload_text_to_drive(content: str, filename: str, folder_id: str = None) ->
     if folder_id:
         metadata['parents'] = [folder_id]
     media = MediaIoBaseUpload(io.BytesIO(content.encode('utf-8')), mimetype='text/plain')
-    file = service.files().create(body=metadata, media_body=media, fields='id').execute()
+    file = service.files().create(body=metadata, media_body=media, fields='id').execute(http=get_drive_http())
     return file['id']
 
 async def save_file_by_id(file_id: str, folder_id: str, filename: str, bot: Bot, user_id: int = None):
     try:
         file = await bot.get_file(file_id)
         file_path = file.file_path
-        file_bytes = await bot.download_file(file_path)
         ext = os.path.splitext(file_path)[-1] or ".bin"
 
         mime_type = "application/octet-stream"
@@ -242,26 +267,59 @@ async def save_file_by_id(file_id: str, folder_id: str, filename: str, bot: Bot,
             extra_data=f"Filename: {filename}{ext}, FolderID: {folder_id}"
         )
 
-        return upload_file_to_folder(file_bytes.read(), f"{filename}{ext}", mime_type, folder_id)
+        # Telegram -> временный файл на диске -> загрузка на Drive по частям
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_path = os.path.join(tmp_dir, f"upload{ext}")
+            await stream_telegram_file(bot, file_path, local_path)
+            size = os.path.getsize(local_path)
+            started = time.perf_counter()
+            try:
+                with open(local_path, 'rb') as f:
+                    file_id = await run_in_drive_executor(upload_stream_to_folder, f, f"{filename}{ext}", mime_type, folder_id)
+            except Exception:
+                observe_file_transfer("drive_upload", started, "error", size)
+                raise
+            observe_file_transfer("drive_upload", started, "ok", size)
+            return file_id
 
     except Exception as e:
         log_error(
             user_id=user_id,
             error=e,
-            action="Failed to upload file",
+            context="Failed to upload file",
             state="save_file_by_id",
         )
         print(f"Error saving file {file_id}: {e}")
         raise
 
-async def save_full_questionnaire_to_drive(user_data: dict, bot: Bot, folder_id: str, user_id: int = None):
+async def delete_drive_objects(object_ids: list, user_id: int = None):
+    """Удаляет файлы и папки (вместе с содержимым), созданные неудачной попыткой сохранения"""
+    for object_id in object_ids:
+        try:
+            await run_in_drive_executor(delete_folder, object_id)
+        except Exception as e:
+            log_error(
+                user_id=user_id,
+                error=e,
+                context=f"Deleting partial upload {object_id}",
+                state="delete_drive_objects",
+            )
+
+async def save_full_questionnaire_to_drive(user_data: dict, bot: Bot, folder_id: str, user_id: int = None) -> dict:
+    """Сохраняет анкету и вложения на Drive и возвращает манифест созданных объектов:
+    {"folder_id", "excel_id", "files_folder_id", "subfolders": {поле: id}, "files": {поле: [id]}}
+
+    При ошибке созданные этой попыткой Excel и папка "Файлы" удаляются, поэтому
+    повтор задачи архивирования не оставляет в папке пациента неполных копий.
+    """
+    created = []
     try:
-        full_name = user_data.get('q1_full_name', 'Пациент')
-        birth_date = user_data.get('q2_birth_date', 'Unknown')
         root_folder_id = folder_id
 
         # Создаем Excel файл анкеты
-        excel_bytes = create_questionnaire_excel_bytes(user_data)
+        excel_bytes = await render_questionnaire_excel_async(
+            build_questionnaire_rows(user_data, QUESTION_LABELS, QUESTION_FILE_KEYS)
+        )
         
         log_user_action(
             user_id=user_id,
@@ -270,11 +328,17 @@ async def save_full_questionnaire_to_drive(user_data: dict, bot: Bot, folder_id:
             extra_data="Анкета.xlsx"
         )
 
-        # Загружаем Excel файл на Drive
-        upload_excel_to_drive(excel_bytes, "Анкета.xlsx", folder_id=root_folder_id)
-
-        # Создаем папку для файлов
-        files_folder_id = create_folder("Файлы", parent_id=root_folder_id)
+        # Excel загружается параллельно с созданием папки для файлов
+        results = await asyncio.gather(
+            run_in_drive_executor(upload_excel_to_drive, excel_bytes, "Анкета.xlsx", folder_id=root_folder_id),
+            run_in_drive_executor(create_folder, "Файлы", parent_id=root_folder_id),
+            return_exceptions=True,
+        )
+        created += [result for result in results if not isinstance(result, Exception)]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        excel_id, files_folder_id = results
         
         log_user_action(
             user_id=user_id,
@@ -283,53 +347,92 @@ async def save_full_questionnaire_to_drive(user_data: dict, bot: Bot, folder_id:
             extra_data=f"Files folder ID: {files_folder_id}"
         )
 
-        # Загружаем вложения в подпапки внутри папки "Файлы"
-        for field, folder_name in QUESTION_FILE_KEYS.items():
-            file_value = user_data.get(field)
-            if not file_value:
-                continue
-
-            # Создаем подпапку для каждого типа документов внутри папки "Файлы"
-            subfolder_id = create_folder(folder_name, parent_id=files_folder_id)
+        # Подпапки создаются только для заполненных полей и одним batch-запросом
+        attachments = {field: user_data[field] for field in QUESTION_FILE_KEYS if user_data.get(field)}
+        subfolders = await run_in_drive_executor(
+            create_folders_batch,
+            {field: QUESTION_FILE_KEYS[field] for field in attachments},
+            files_folder_id,
+        )
 
-            log_user_action(
-                user_id=user_id,
-                action="Created subfolder for attachments",
-                state="save_full_questionnaire_to_drive",
-                extra_data=f"{folder_name} (Field: {field})"
-            )
+        log_user_action(
+            user_id=user_id,
+            action="Created subfolders for attachments",
+            state="save_full_questionnaire_to_drive",
+            extra_data=", ".join(QUESTION_FILE_KEYS[field] for field in subfolders)
+        )
 
+        # Загружаем вложения в подпапки внутри папки "Файлы",
+        # не более DRIVE_TRANSFER_CONCURRENCY скачиваний и загрузок одновременно
+        semaphore = asyncio.Semaphore(DRIVE_TRANSFER_CONCURRENCY)
+        failed = asyncio.Event()
+
+        async def transfer(file_id: str, subfolder_id: str, filename: str):
+            async with semaphore:
+                if failed.is_set():
+                    # После первой ошибки оставшиеся вложения не скачиваем: попытка все равно будет повторена
+                    return None
+                try:
+                    return await save_file_by_id(file_id, subfolder_id, filename, bot, user_id)
+                except Exception:
+                    failed.set()
+                    raise
+
+        uploads = []
+        for field, file_value in attachments.items():
+            folder_name = QUESTION_FILE_KEYS[field]
             if isinstance(file_value, list):
                 # Если несколько файлов
                 for idx, file_id in enumerate(file_value):
                     if file_id:
-                        await save_file_by_id(file_id, subfolder_id, f"{folder_name}_{idx+1}", bot, user_id)
+                        uploads.append((field, transfer(file_id, subfolders[field], f"{folder_name}_{idx+1}")))
             else:
                 # Если один файл
-                await save_file_by_id(file_value, subfolder_id, folder_name, bot, user_id)
+                uploads.append((field, transfer(file_value, subfolders[field], folder_name)))
+
+        uploaded_ids = await asyncio.gather(*(upload for _, upload in uploads), return_exceptions=True)
+        errors = [result for result in uploaded_ids if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+
+        files = {field: [] for field in attachments}
+        for (field, _), uploaded_id in zip(uploads, uploaded_ids):
+            files[field].append(uploaded_id)
+
+        manifest = {
+            "folder_id": root_folder_id,
+            "excel_id": excel_id,
+            "files_folder_id": files_folder_id,
+            "subfolders": subfolders,
+            "files": files,
+        }
 
         log_user_action(
             user_id=user_id,
             action="Finished saving questionnaire",
-            state="save_full_questionnaire_to_drive"
+            state="save_full_questionnaire_to_drive",
+            extra_data=f"Uploaded files: {len(uploaded_ids)}"
         )
+        return manifest
 
     except Exception as e:
         log_error(
             user_id=user_id,
             error=e,
-            action="Error saving questionnaire",
+            context="Error saving questionnaire",
             state="save_full_questionnaire_to_drive",
         )
         print(f"❌ Error in save_full_questionnaire_to_drive: {e}")
+        await delete_drive_objects(created, user_id)
         raise
 
 def delete_folder(folder_id: str):
+    """Удаляет файл или папку Drive; HttpError пробрасывается вызывающему"""
     try:
         service = get_drive_service()
-        service.files().delete(fileId=folder_id).execute()
-        print(f"✅ Папка с ID {folder_id} успешно удалена.")
+        service.files().delete(fileId=folder_id).execute(http=get_drive_http())
+        logger.info(f"✅ Папка с ID {folder_id} успешно удалена.")
         return True
     except HttpError as e:
-        print(f"❌ Ошибка при удалении папки: {e}")
-        return False
\ No newline at end of file
+        logger.error(f"❌ Ошибка при удалении папки {folder_id}: {e}")
+        raise
\ No newline at end of file
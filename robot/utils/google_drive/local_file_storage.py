@@ -1,13 +1,19 @@
 import os
+import time
 import asyncio
 from pathlib import Path
 from aiogram import Bot
-import pandas as pd
+from robot.utils.google_drive.telegram_files import stream_telegram_file
 from robot.utils.misc.logging import log_handler, log_user_action, log_state_change, log_error, log_file_operation
 
 # Базовая папка для сохранения всех анкет
 BASE_STORAGE_PATH = "questionnaire_storage"
 
+# Параметры скачивания вложений из Telegram
+DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_RETRY_DELAY = 1.0
+
 QUESTION_LABELS = {
     "q1_full_name": "ФИО",
     "q2_birth_date": "Дата рождения",
@@ -77,112 +83,27 @@ def create_local_folder(name: str, parent_path: str = None) -> str:
 
 def save_questionnaire_to_excel(user_data: dict, folder_path: str, filename: str = "Анкета.xlsx") -> str:
     """Сохраняет анкету в Excel файл с двумя столбцами: Вопрос и Ответ"""
-    try:
-        # Подготавливаем данные для таблицы
-        questions = []
-        answers = []
-        
-        # Добавляем ФИО первым
-        full_name = user_data.get('q1_full_name', '')
-        if full_name:
-            questions.append("ФИО")
-            answers.append(full_name)
-
-        # Обрабатываем остальные вопросы
-        for key, value in user_data.items():
-            if key == "q1_full_name" or key == "full_name":
-                continue
-                
-            label = QUESTION_LABELS.get(key, key)
-
-            if key in QUESTION_FILE_KEYS:
-                # Для файлов показываем статус наличия
-                if isinstance(value, list):
-                    answer = f"{len(value)} файл(ов) ✅" if value else "—"
-                else:
-                    answer = "Есть файл ✅" if value else "—"
-            else:
-                # Для обычных ответов
-                answer = str(value) if value is not None else "—"
-            
-            questions.append(label)
-            answers.append(answer)
-
-        # Создаем DataFrame
-        df = pd.DataFrame({
-            'Вопрос': questions,
-            'Ответ': answers
-        })
+    # openpyxl (и numpy через него) загружается только при первом сохранении анкеты
+    from robot.utils.google_drive.excel import build_questionnaire_rows, write_questionnaire_excel
 
-        # Сохраняем в Excel
+    try:
         excel_path = os.path.join(folder_path, filename)
-        
-        # Создаем Excel writer с настройками
-        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Анкета', index=False)
-            
-            # Получаем worksheet для настройки форматирования
-            worksheet = writer.sheets['Анкета']
-            
-            # Настраиваем ширину столбцов
-            worksheet.column_dimensions['A'].width = 45  # Столбец "Вопрос"
-            worksheet.column_dimensions['B'].width = 65  # Столбец "Ответ"
-            
-            # Импортируем стили для форматирования
-            from openpyxl.styles import Alignment, Border, Side, PatternFill, Font
-            
-            # Определяем стили
-            header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")  # Синий фон для заголовков
-            header_font = Font(color="FFFFFF", bold=True, size=12)  # Белый жирный текст
-            
-            question_fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")  # Светло-серый для вопросов
-            question_font = Font(bold=True, size=11)  # Жирный текст для вопросов
-            
-            answer_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")  # Белый для ответов
-            answer_font = Font(size=11)  # Обычный текст для ответов
-            
-            # Создаем границы
-            thin_border = Border(
-                left=Side(style='thin', color='000000'),
-                right=Side(style='thin', color='000000'),
-                top=Side(style='thin', color='000000'),
-                bottom=Side(style='thin', color='000000')
-            )
-            
-            # Форматируем заголовки (первая строка)
-            for col in range(1, 3):  # Столбцы A и B
-                cell = worksheet.cell(row=1, column=col)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.border = thin_border
-                cell.alignment = Alignment(wrap_text=True, vertical='center', horizontal='center')
-            
-            # Форматируем остальные строки
-            for row in range(2, len(df) + 2):  # Начинаем со второй строки
-                # Столбец A (Вопросы) - серый фон
-                question_cell = worksheet.cell(row=row, column=1)
-                question_cell.fill = question_fill
-                question_cell.font = question_font
-                question_cell.border = thin_border
-                question_cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
-                
-                # Столбец B (Ответы) - белый фон
-                answer_cell = worksheet.cell(row=row, column=2)
-                answer_cell.fill = answer_fill
-                answer_cell.font = answer_font
-                answer_cell.border = thin_border
-                answer_cell.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
-            
-            # Устанавливаем высоту строк для лучшего отображения
-            for row in range(1, len(df) + 2):
-                worksheet.row_dimensions[row].height = 25
-
+        write_questionnaire_excel(build_questionnaire_rows(user_data, QUESTION_LABELS, QUESTION_FILE_KEYS), excel_path)
         return excel_path
 
     except Exception as e:
         print(f"❌ Ошибка при сохранении Excel: {e}")
         raise
 
+async def save_questionnaire_to_excel_async(user_data: dict, folder_path: str, filename: str = "Анкета.xlsx") -> str:
+    """То же, что save_questionnaire_to_excel, но запись выполняется вне event loop.
+    Ошибка записи не перехватывается: ее логирует вызывающий (save_full_questionnaire_locally)"""
+    from robot.utils.google_drive.excel import build_questionnaire_rows, write_questionnaire_excel_async
+
+    excel_path = os.path.join(folder_path, filename)
+    await write_questionnaire_excel_async(build_questionnaire_rows(user_data, QUESTION_LABELS, QUESTION_FILE_KEYS), excel_path)
+    return excel_path
+
 def save_text_to_local_file(content: str, filename: str, folder_path: str) -> str:
     """Сохраняет текст в локальный файл (оставлено для совместимости)"""
     safe_filename = create_safe_filename(filename)
@@ -194,11 +115,10 @@ def save_text_to_local_file(content: str, filename: str, folder_path: str) -> st
     return file_path
 
 async def save_telegram_file_locally(file_id: str, folder_path: str, filename: str, bot: Bot, user_id: int = None) -> str:
-    """Скачивает файл из Telegram и сохраняет локально"""
+    """Скачивает файл из Telegram и потоково сохраняет локально"""
     try:
         file = await bot.get_file(file_id)
         file_path = file.file_path
-        file_bytes = await bot.download_file(file_path)
         
         # Получаем расширение файла
         ext = os.path.splitext(file_path)[-1] or ".bin"
@@ -206,9 +126,8 @@ async def save_telegram_file_locally(file_id: str, folder_path: str, filename: s
         
         local_file_path = os.path.join(folder_path, safe_filename)
         
-        # Сохраняем файл
-        with open(local_file_path, 'wb') as f:
-            f.write(file_bytes.read())
+        # Сохраняем файл по частям через временный файл, не держа его целиком в памяти
+        await stream_telegram_file(bot, file_path, local_file_path)
         
         log_user_action(
             user_id=user_id,
@@ -223,12 +142,49 @@ async def save_telegram_file_locally(file_id: str, folder_path: str, filename: s
         log_error(
             user_id=user_id,
             error=e,
-            action="Failed to save file locally",
+            context="Failed to save file locally",
             state="save_telegram_file_locally",
         )
         print(f"❌ Error saving file {file_id}: {e}")
         raise
 
+async def download_with_retry(file_id: str, folder_path: str, filename: str, bot: Bot,
+                              semaphore: asyncio.Semaphore, user_id: int = None) -> dict:
+    """Скачивает один файл с ограничением параллельности и повторными попытками"""
+    async with semaphore:
+        started = time.perf_counter()
+        for attempt in range(1, DOWNLOAD_RETRIES + 1):
+            try:
+                path = await save_telegram_file_locally(file_id, folder_path, filename, bot, user_id)
+                return {
+                    'filename': filename,
+                    'path': path,
+                    'attempts': attempt,
+                    'duration': time.perf_counter() - started,
+                }
+            except Exception:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                log_user_action(
+                    user_id=user_id,
+                    action="Retrying file download",
+                    state="download_with_retry",
+                    extra_data=f"File: {filename}, attempt: {attempt + 1}/{DOWNLOAD_RETRIES}"
+                )
+                await asyncio.sleep(DOWNLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+
+def format_download_report(results: list, elapsed: float) -> str:
+    """Сводка по скачиванию: общее время, суммарное время файлов и самый медленный файл"""
+    if not results:
+        return f"Files: 0, elapsed: {elapsed:.2f}s"
+    slowest = max(results, key=lambda r: r['duration'])
+    total = sum(r['duration'] for r in results)
+    retried = sum(1 for r in results if r['attempts'] > 1)
+    return (
+        f"Files: {len(results)}, elapsed: {elapsed:.2f}s, sum of downloads: {total:.2f}s, "
+        f"slowest: {slowest['filename']} ({slowest['duration']:.2f}s), retried: {retried}"
+    )
+
 async def save_full_questionnaire_locally(user_data: dict, bot: Bot, user_id: int = None) -> str:
     """Сохраняет всю анкету в локальную папку с Excel файлом"""
     try:
@@ -240,7 +196,7 @@ async def save_full_questionnaire_locally(user_data: dict, bot: Bot, user_id: in
         patient_folder_path = create_local_folder(folder_name)
         
         # Сохраняем анкету в Excel формате
-        excel_file_path = save_questionnaire_to_excel(user_data, patient_folder_path)
+        excel_file_path = await save_questionnaire_to_excel_async(user_data, patient_folder_path)
         
         log_user_action(
             user_id=user_id,
@@ -259,7 +215,9 @@ async def save_full_questionnaire_locally(user_data: dict, bot: Bot, user_id: in
             extra_data=f"Files folder: {files_folder_path}"
         )
 
-        # Сохраняем файлы-вложения
+        # Сохраняем файлы-вложения параллельно, не более DOWNLOAD_CONCURRENCY одновременно
+        semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+        downloads = []
         for field, folder_name in QUESTION_FILE_KEYS.items():
             file_value = user_data.get(field)
             if not file_value:
@@ -279,22 +237,37 @@ async def save_full_questionnaire_locally(user_data: dict, bot: Bot, user_id: in
                 # Если несколько файлов
                 for idx, file_id in enumerate(file_value):
                     if file_id:
-                        await save_telegram_file_locally(
+                        downloads.append(download_with_retry(
                             file_id, 
                             subfolder_path, 
                             f"{folder_name}_{idx+1}", 
                             bot, 
+                            semaphore,
                             user_id
-                        )
+                        ))
             else:
                 # Если один файл
-                await save_telegram_file_locally(
+                downloads.append(download_with_retry(
                     file_value, 
                     subfolder_path, 
                     folder_name, 
                     bot, 
+                    semaphore,
                     user_id
-                )
+                ))
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*downloads, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+
+        log_user_action(
+            user_id=user_id,
+            action="Attachments downloaded",
+            state="save_full_questionnaire_locally",
+            extra_data=format_download_report(results, time.perf_counter() - started)
+        )
 
         log_user_action(
             user_id=user_id,
@@ -309,7 +282,7 @@ async def save_full_questionnaire_locally(user_data: dict, bot: Bot, user_id: in
         log_error(
             user_id=user_id,
             error=e,
-            action="Error saving questionnaire locally",
+            context="Error saving questionnaire locally",
             state="save_full_questionnaire_locally",
         )
         print(f"❌ Error in save_full_questionnaire_locally: {e}")
@@ -0,0 +1,50 @@
+from aiogram import Bot
+from django.conf import settings
+
+DRIVE_FOLDER_URL = "https://drive.google.com/drive/folders/{}"
+
+
+def is_local_storage() -> bool:
+    return settings.QUESTIONNAIRE_STORAGE == "local"
+
+
+async def save_questionnaire(user_data: dict, bot: Bot, user_id: int = None, drive_folder_id: str = None) -> tuple:
+    """Сохраняет анкету в хранилище из настройки QUESTIONNAIRE_STORAGE.
+
+    Модули хранилищ импортируются здесь, а не на уровне модуля, поэтому
+    неиспользуемый бэкенд вместе с его зависимостями не загружается вовсе.
+    Возвращает (folder_id, folder_url) для записи в Patient.
+    """
+    backend = settings.QUESTIONNAIRE_STORAGE
+
+    if backend == "local":
+        from robot.utils.google_drive.local_file_storage import save_full_questionnaire_locally
+
+        folder_path = await save_full_questionnaire_locally(user_data, bot, user_id=user_id)
+        return folder_path, f"file://{folder_path}"
+
+    if backend == "drive":
+        from robot.utils.google_drive.google_drive import (
+            PARENT_FOLDER_ID,
+            create_folder,
+            delete_drive_objects,
+            run_in_drive_executor,
+            save_full_questionnaire_to_drive,
+        )
+
+        created_folder = not drive_folder_id
+        if created_folder:
+            full_name = user_data.get("q1_full_name", "Пациент")
+            drive_folder_id = await run_in_drive_executor(
+                create_folder, f"Анкета пациента – {full_name}", parent_id=PARENT_FOLDER_ID
+            )
+        try:
+            await save_full_questionnaire_to_drive(user_data, bot, folder_id=drive_folder_id, user_id=user_id)
+        except Exception:
+            # Папка этой попытки еще нигде не записана: без удаления повтор задачи создал бы вторую
+            if created_folder:
+                await delete_drive_objects([drive_folder_id], user_id)
+            raise
+        return drive_folder_id, DRIVE_FOLDER_URL.format(drive_folder_id)
+
+    raise ValueError(f"Unknown QUESTIONNAIRE_STORAGE: {backend!r}")
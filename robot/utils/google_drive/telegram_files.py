@@ -0,0 +1,47 @@
+import os
+import time
+import uuid
+
+import aiofiles
+from aiogram import Bot
+
+from robot.utils.misc.logging import log_event
+from robot.utils.misc.metrics import FILE_TRANSFER_SECONDS
+
+# Размер буфера при скачивании: столько байт файла одновременно находится в памяти
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def observe_file_transfer(operation: str, started: float, status: str, size: int = None):
+    """Длительность передачи файла: гистограмма sabo_file_transfer_duration_seconds и событие file_transfer"""
+    duration = time.perf_counter() - started
+    FILE_TRANSFER_SECONDS.observe(duration, operation=operation, status=status)
+    log_event("file_transfer", operation=operation, status=status, size=size, duration_ms=round(duration * 1000, 2))
+
+
+async def stream_telegram_file(bot: Bot, file_path: str, destination: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> int:
+    """Потоково скачивает файл из Telegram на диск и возвращает его размер.
+
+    Данные пишутся во временный файл рядом с destination, который атомарно
+    переименовывается только после успешного скачивания, поэтому оборванная
+    загрузка никогда не оставляет частичный файл под итоговым именем.
+    """
+    tmp_path = f"{destination}.{uuid.uuid4().hex[:8]}.part"
+    url = bot.session.api.file_url(bot.token, file_path)
+    size = 0
+    started = time.perf_counter()
+
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            async for chunk in bot.session.stream_content(url, chunk_size=chunk_size):
+                await f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        observe_file_transfer("telegram_download", started, "error", size)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    observe_file_transfer("telegram_download", started, "ok", size)
+    return size
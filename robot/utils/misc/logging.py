@@ -1,139 +1,354 @@
-import logging
-import os
-from datetime import datetime
-import sys
-
-os.makedirs("logs", exist_ok=True)
-
-class DetailedFormatter(logging.Formatter):
-    def format(self, record):
-        if hasattr(record, 'user_id'):
-            record.user_info = f"[USER:{record.user_id}]"
-        else:
-            record.user_info = ""
-            
-        if hasattr(record, 'state'):
-            record.state_info = f"[STATE:{record.state}]"
-        else:
-            record.state_info = ""
-            
-        return super().format(record)
-
-formatter = DetailedFormatter(
-    fmt="%(asctime)s [%(levelname)s] %(filename)s:%(lineno)d %(user_info)s %(state_info)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
-
-logger = logging.getLogger("sabo_bot")
-logger.setLevel(logging.DEBUG)
-logger.propagate = False # удалить чтобы вывести в терминал
-logger.handlers.clear()
-
-file_handler = logging.FileHandler(
-    f"logs/bot_{datetime.now().strftime('%Y%m%d')}.log", 
-    mode="a", 
-    encoding="utf-8"
-)
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(formatter)
-
-error_handler = logging.FileHandler(
-    f"logs/errors_{datetime.now().strftime('%Y%m%d')}.log", 
-    mode="a", 
-    encoding="utf-8"
-)
-error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(formatter)
-
-# console_handler = logging.StreamHandler(sys.stdout)
-# console_handler.setLevel(logging.INFO)
-# console_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(error_handler)
-# logger.addHandler(console_handler)
-
-def log_user_action(user_id, action, state=None, extra_data=None):
-    """Логирование действий пользователя"""
-    extra = {'user_id': user_id}
-    if state:
-        extra['state'] = state
-    
-    msg = f"User action: {action}"
-    if extra_data:
-        msg += f" | Data: {extra_data}"
-    
-    logger.info(msg, extra=extra)
-
-def log_state_change(user_id, old_state, new_state):
-    """Логирование изменения состояния"""
-    extra = {'user_id': user_id, 'state': f"{old_state}->{new_state}"}
-    logger.info(f"State changed: {old_state} -> {new_state}", extra=extra)
-
-def log_error(user_id, error, context=None, state=None):
-    """Логирование ошибок"""
-    extra = {'user_id': user_id}
-    if state:
-        extra['state'] = state
-    
-    msg = f"Error occurred: {str(error)}"
-    if context:
-        msg += f" | Context: {context}"
-    
-    logger.error(msg, extra=extra, exc_info=True)
-
-def log_file_operation(user_id, operation, file_info, success=True):
-    """Логирование файловых операций"""
-    extra = {'user_id': user_id}
-    status = "SUCCESS" if success else "FAILED"
-    logger.info(f"File operation {status}: {operation} | {file_info}", extra=extra)
-
-def log_handler(func):
-    """Декоратор для логирования всех хендлеров"""
-    import functools
-    import inspect
-
-    @functools.wraps(func)
-    async def wrapper(*args, **kwargs):
-        message = None
-        state = None
-
-        sig = inspect.signature(func)
-        bound_args = sig.bind(*args, **kwargs)
-        bound_args.apply_defaults()
-
-        for param_name, param_value in bound_args.arguments.items():
-            if hasattr(param_value, 'from_user') and hasattr(param_value, 'chat'):
-                message = param_value
-            elif hasattr(param_value, 'get_state'):
-                state = param_value
-
-        user_id = message.from_user.id if message and hasattr(message, 'from_user') else 'unknown'
-        current_state = await state.get_state() if state else None
-
-        text_value = getattr(message, 'text', None)
-        if text_value is None:
-            extra = f"Content type: {getattr(message, 'content_type', 'unknown')}"
-        else:
-            extra = f"Text: {text_value[:50]}"
-
-        log_user_action(
-            user_id=user_id,
-            action=f"Handler: {func.__name__}",
-            state=current_state,
-            extra_data=extra
-        )
-
-        try:
-            result = await func(*args, **kwargs)
-            return result
-        except Exception as e:
-            log_error(
-                user_id=user_id,
-                error=e,
-                context=f"Handler: {func.__name__}",
-                state=current_state
-            )
-            raise
-
-    return wrapper
+import atexit
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+
+os.makedirs(settings.LOG_DIR, exist_ok=True)
+
+class DetailedFormatter(logging.Formatter):
+    def format(self, record):
+        if hasattr(record, 'user_id'):
+            record.user_info = f"[USER:{record.user_id}]"
+        else:
+            record.user_info = ""
+            
+        if hasattr(record, 'state'):
+            record.state_info = f"[STATE:{record.state}]"
+        else:
+            record.state_info = ""
+
+        # Поля структурированного события (log_event) форматируются уже в потоке записи
+        event_data = getattr(record, 'event_data', None)
+        if event_data:
+            record.event_info = " | " + " ".join(f"{key}={value}" for key, value in event_data.items())
+        else:
+            record.event_info = ""
+            
+        return super().format(record)
+
+formatter = DetailedFormatter(
+    fmt="%(asctime)s [%(levelname)s] %(filename)s:%(lineno)d %(user_info)s %(state_info)s - %(message)s%(event_info)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+
+class JsonEventFormatter(logging.Formatter):
+    """Одна JSON-строка на событие log_event: для разбора событий и длительностей скриптами"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        for key in ("user_id", "state"):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        entry.update(record.event_data)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Кладет записи в ограниченную очередь, не блокируя event loop.
+
+    Если фоновый писатель не успевает и очередь заполнена, запись отбрасывается,
+    а счетчик dropped (по уровням) растет. Когда место появляется, в лог пишется
+    предупреждение о числе потерянных записей.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = Counter()
+        self._unreported = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped[record.levelname] += 1
+                self._unreported += 1
+            return
+
+        if self._unreported:
+            with self._lock:
+                unreported, self._unreported = self._unreported, 0
+            if unreported:
+                warning = logging.makeLogRecord({
+                    "name": record.name,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Log queue overflow: {unreported} records dropped",
+                })
+                try:
+                    self.queue.put_nowait(warning)
+                except queue.Full:
+                    pass
+
+
+class LogQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Очередь может быть заполнена: при остановке ждем, пока поток освободит место
+        self.queue.put(self._sentinel)
+
+
+def _process_role() -> str:
+    """runbot, runserver, celery... — по команде, которой запущен процесс"""
+    argv = [os.path.basename(arg) for arg in sys.argv[:2]] or ["python"]
+    role = argv[1] if argv[0] == "manage.py" and len(argv) > 1 else os.path.splitext(argv[0])[0]
+    return re.sub(r"[^\w-]", "_", role) or "python"
+
+
+HOSTNAME = re.sub(r"[^\w-]", "_", socket.gethostname())
+# bot.runbot.web-1.42.log: контейнеры делят папку logs (volume), а воркеры Celery — fork одного процесса
+LOG_FILE_RE = re.compile(
+    r"^(?:bot|errors|events)\.[\w-]+\.(?P<host>[\w-]+)\.(?P<pid>\d+)\.(?:log|jsonl)(?P<rotated>\.\d{4}-\d{2}-\d{2})?$"
+)
+
+
+def process_log_filename(name: str, extension: str = "log") -> str:
+    """Имя файла логов текущего процесса.
+
+    У каждого файла ровно один писатель: TimedRotatingFileHandler переименовывает
+    файл в полночь и удаляет файл с тем же именем, поэтому общий bot.log для
+    нескольких процессов терял бы записи при ротации.
+    """
+    return f"{name}.{_process_role()}.{HOSTNAME}.{os.getpid()}.{extension}"
+
+
+def build_file_handler(filename: str, level: int) -> logging.Handler:
+    """Файл в LOG_DIR, который каждую полночь переименовывается в filename.YYYY-MM-DD"""
+    handler = logging.handlers.TimedRotatingFileHandler(
+        os.path.join(settings.LOG_DIR, filename),
+        when="midnight",
+        backupCount=settings.LOG_BACKUP_COUNT,
+        encoding="utf-8",
+        delay=True,
+    )
+    handler.setLevel(level)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def build_log_handlers() -> list:
+    handlers = [
+        build_file_handler(process_log_filename("bot"), logging.DEBUG),
+        build_file_handler(process_log_filename("errors"), logging.ERROR),
+    ]
+    # Структурированные события (log_event) дополнительно пишутся в events.*.jsonl
+    events_handler = build_file_handler(process_log_filename("events", "jsonl"), logging.DEBUG)
+    events_handler.setFormatter(JsonEventFormatter())
+    events_handler.addFilter(lambda record: hasattr(record, "event_data"))
+    handlers.append(events_handler)
+    return handlers
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def prune_old_logs():
+    """Удаляет файлы логов старше LOG_BACKUP_COUNT дней, которые уже никто не пишет.
+
+    backupCount чистит только ротированные файлы своего процесса; здесь удаляются
+    ротированные файлы любых процессов и файлы завершившихся процессов этого хоста.
+    """
+    cutoff = time.time() - settings.LOG_BACKUP_COUNT * 86400
+    for entry in os.scandir(settings.LOG_DIR):
+        match = LOG_FILE_RE.match(entry.name)
+        if not match:
+            continue
+        finished = match["host"] == HOSTNAME and not _pid_alive(int(match["pid"]))
+        try:
+            if (match["rotated"] or finished) and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+# console_handler = logging.StreamHandler(sys.stdout)
+# console_handler.setLevel(logging.INFO)
+# console_handler.setFormatter(formatter)
+
+# Файловые хендлеры вызываются только из потока log_listener, диск не задерживает обработку апдейтов
+queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+log_listener = None
+
+
+def start_log_listener():
+    """Запускает фоновый поток записи логов со свежей очередью и файлами текущего процесса"""
+    global log_listener
+    queue_handler.queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    log_listener = LogQueueListener(
+        queue_handler.queue, *build_log_handlers(),
+        respect_handler_level=True
+    )
+    log_listener.start()
+
+
+def stop_log_listener():
+    """Дописывает оставшиеся в очереди записи и останавливает поток"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+
+prune_old_logs()
+start_log_listener()
+atexit.register(stop_log_listener)
+# Потоки не наследуются при fork (воркеры Celery): в дочернем процессе запускаем свой
+# поток со своими файлами (в имени pid дочернего процесса)
+os.register_at_fork(after_in_child=start_log_listener)
+
+logger = logging.getLogger("sabo_bot")
+logger.setLevel(logging.DEBUG)
+logger.propagate = False # удалить чтобы вывести в терминал
+logger.handlers.clear()
+logger.addHandler(queue_handler)
+
+
+def get_log_queue_stats() -> dict:
+    """Заполненность очереди логов и число отброшенных записей по уровням"""
+    return {
+        "queued": queue_handler.queue.qsize(),
+        "capacity": queue_handler.queue.maxsize,
+        "dropped": dict(queue_handler.dropped),
+    }
+
+def log_user_action(user_id, action, state=None, extra_data=None):
+    """Логирование действий пользователя"""
+    extra = {'user_id': user_id}
+    if state:
+        extra['state'] = state
+    
+    msg = f"User action: {action}"
+    if extra_data:
+        msg += f" | Data: {extra_data}"
+    
+    logger.info(msg, extra=extra)
+
+def log_state_change(user_id, old_state, new_state, back=False):
+    """Логирование изменения состояния (back=True — возврат кнопкой "Назад")"""
+    extra = {'user_id': user_id, 'state': f"{old_state}->{new_state}"}
+    suffix = " (back)" if back else ""
+    logger.info(f"State changed: {old_state} -> {new_state}{suffix}", extra=extra)
+
+def log_error(user_id, error, context=None, state=None):
+    """Логирование ошибок"""
+    extra = {'user_id': user_id}
+    if state:
+        extra['state'] = state
+    
+    msg = f"Error occurred: {str(error)}"
+    if context:
+        msg += f" | Context: {context}"
+    
+    logger.error(msg, extra=extra, exc_info=True)
+
+def log_file_operation(user_id, operation, file_info, success=True):
+    """Логирование файловых операций"""
+    extra = {'user_id': user_id}
+    status = "SUCCESS" if success else "FAILED"
+    logger.info(f"File operation {status}: {operation} | {file_info}", extra=extra)
+
+def log_event(event, user_id=None, state=None, level=logging.INFO, **fields):
+    """Структурированное событие: имя события и поля без предварительного форматирования строки"""
+    if not logger.isEnabledFor(level):
+        return
+    extra = {'event_data': fields}
+    if user_id is not None:
+        extra['user_id'] = user_id
+    if state:
+        extra['state'] = state
+    logger.log(level, event, extra=extra, stacklevel=2)
+
+_EVENT_PARAM_NAMES = ("message", "callback_query", "callback", "call", "query", "event")
+
+
+def _find_param(params, predicate):
+    """(позиция, имя) первого параметра, для которого predicate истинен"""
+    for index, param in enumerate(params):
+        if predicate(param):
+            position = index if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD) else None
+            return position, param.name
+    return None, None
+
+
+def _get_argument(args, kwargs, position, name):
+    if position is not None and position < len(args):
+        return args[position]
+    return kwargs.get(name)
+
+
+def log_handler(func):
+    """Декоратор для логирования всех хендлеров.
+
+    Параметры с событием (Message/CallbackQuery) и FSMContext определяются один раз
+    при декорировании по аннотациям или именам. Состояние FSM запрашивается только
+    при ошибке, вход в хендлер пишется событием handler_called.
+    """
+    params = list(inspect.signature(func).parameters.values())
+    event_position, event_name = _find_param(
+        params,
+        lambda p: "from_user" in getattr(p.annotation, "model_fields", ()) or p.name in _EVENT_PARAM_NAMES,
+    )
+    state_position, state_name = _find_param(
+        params,
+        lambda p: getattr(p.annotation, "__name__", None) == "FSMContext" or p.name == "state",
+    )
+    handler_name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        event = _get_argument(args, kwargs, event_position, event_name) if event_name else None
+        from_user = getattr(event, 'from_user', None)
+        user_id = from_user.id if from_user else 'unknown'
+
+        if logger.isEnabledFor(logging.INFO):
+            text_value = getattr(event, 'text', None) or getattr(event, 'data', None)
+            if isinstance(text_value, str):
+                log_event("handler_called", user_id=user_id, handler=handler_name, text=text_value[:50])
+            else:
+                log_event("handler_called", user_id=user_id, handler=handler_name,
+                          content_type=getattr(event, 'content_type', 'unknown'))
+
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            state = _get_argument(args, kwargs, state_position, state_name) if state_name else None
+            current_state = None
+            if state is not None:
+                try:
+                    current_state = await state.get_state()
+                except Exception:
+                    pass
+            log_error(
+                user_id=user_id,
+                error=e,
+                context=f"Handler: {handler_name}",
+                state=current_state
+            )
+            raise
+
+    return wrapper
@@ -0,0 +1,133 @@
+"""Гистограммы задержек в памяти процесса и их выдача в текстовом формате Prometheus"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY = []
+COLLECTORS = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Histogram:
+    """Потокобезопасная гистограмма с метками, как prometheus_client.Histogram"""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Значения меток -> [счетчики по корзинам (последняя — +Inf), сумма]
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self) -> list:
+        with self._lock:
+            snapshot = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, counts, total in sorted(snapshot):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+def register_collector(func):
+    """func() возвращает строки метрик, вычисляемых в момент запроса (например, gauge)"""
+    COLLECTORS.append(func)
+    return func
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    for collector in COLLECTORS:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+HANDLER_SECONDS = Histogram(
+    "sabo_bot_handler_duration_seconds",
+    "Bot handler latency by handler and FSM state",
+    ("handler", "state", "status"),
+)
+DB_CALL_SECONDS = Histogram(
+    "sabo_db_call_duration_seconds",
+    "Duration of ORM calls made from async code via db_call",
+    ("operation", "status"),
+)
+FILE_TRANSFER_SECONDS = Histogram(
+    "sabo_file_transfer_duration_seconds",
+    "Duration of Telegram downloads and storage uploads",
+    ("operation", "status"),
+)
+
+
+@register_collector
+def collect_log_queue() -> list:
+    from .logging import get_log_queue_stats
+
+    stats = get_log_queue_stats()
+    lines = [
+        "# HELP sabo_log_queue_depth Records waiting in the log queue",
+        "# TYPE sabo_log_queue_depth gauge",
+        f"sabo_log_queue_depth {stats['queued']}",
+        "# HELP sabo_log_records_dropped_total Log records dropped because the queue was full",
+        "# TYPE sabo_log_records_dropped_total counter",
+    ]
+    lines.extend(
+        f"sabo_log_records_dropped_total{_format_labels({'level': level})} {count}"
+        for level, count in sorted(stats["dropped"].items())
+    )
+    return lines
+
+
+async def start_metrics_server(host: str, port: int):
+    """HTTP-сервер с одним маршрутом GET /metrics; возвращает AppRunner для остановки"""
+    from aiohttp import web
+
+    async def metrics(request):
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
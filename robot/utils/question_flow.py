@@ -0,0 +1,128 @@
+"""Граф анкеты из QUESTION_FLOW, скомпилированный один раз при импорте.
+
+FLOW[имя шага] содержит все, что нужно апдейту: текст вопроса, готовую клавиатуру,
+ключ ответа, следующий шаг с условными пропусками и предыдущий шаг для кнопки "Назад".
+"""
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+from robot.states import QuestionnaireStates
+from .question_labels import QUESTION_FLOW, get_keyboard_for, get_multi_choice_keyboard, get_question_label
+
+BACK_BUTTON = "⬅️ Назад"
+
+# Шаг перед анкетой (согласие с правилами) — первый шаг воронки
+STATE_ORDER = ["ConfirmRules", *QUESTION_FLOW]
+
+
+def _reply_keyboard(*buttons: KeyboardButton, one_time: bool = True) -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[[button] for button in buttons] + [[KeyboardButton(text=BACK_BUTTON)]],
+        resize_keyboard=True,
+        one_time_keyboard=one_time
+    )
+
+
+def _build_keyboard(name: str, spec: dict):
+    input_type = spec["input_type"]
+    if input_type == "multi_buttons":
+        return get_multi_choice_keyboard(name)
+    if spec.get("options"):
+        return get_keyboard_for(name)
+    if input_type == "contact":
+        return _reply_keyboard(KeyboardButton(text="📱 Отправить номер", request_contact=True))
+    if input_type == "username":
+        return _reply_keyboard(KeyboardButton(text="👤 Отправить Telegram username"))
+    if input_type == "file_multiple":
+        return _reply_keyboard(KeyboardButton(text=spec["finish_button"]), one_time=False)
+    if spec.get("back_button"):
+        return _reply_keyboard()
+    return ReplyKeyboardRemove()
+
+
+class Step:
+    """Скомпилированный шаг анкеты"""
+
+    def __init__(self, name: str, spec: dict):
+        self.name = name
+        self.state = getattr(QuestionnaireStates, name)
+        self.input_type = spec["input_type"]
+        self.label = get_question_label(name)
+        self.keyboard = _build_keyboard(name, spec)
+        self.options = frozenset(spec.get("options") or ())
+        self.ignore_case = spec.get("ignore_case", False)
+        self._options_casefold = {option.casefold(): option for option in self.options}
+        self.any_file = spec.get("any_file", False)
+        self.finish_button = spec.get("finish_button")
+        self.data_key = spec.get("data_key")
+        self.value_format = spec.get("value_format", "{}")
+        self.initial = spec.get("initial")
+        self.clear_keys = tuple(key for key in (self.data_key, *spec.get("clear", ())) if key)
+        self.done_message = spec.get("done_message")
+        self.error = spec.get("error")
+        self.default_next = spec.get("next")
+        self.branches = tuple(spec.get("branches", ()))
+        self.branch_messages = dict(spec.get("branch_messages", {}))
+        # Заполняются в compile_flow по входящим ребрам графа
+        self.conditional_previous = ()
+        self.unconditional_previous = None
+
+    @property
+    def targets(self):
+        return [target for target, _ in self.branches] + ([self.default_next] if self.default_next else [])
+
+    def match_option(self, text: str):
+        """Вариант из options, которому соответствует ответ (None, если такого нет)"""
+        if self.ignore_case:
+            return self._options_casefold.get(text.casefold())
+        return text if text in self.options else None
+
+    def next_step(self, data: dict):
+        """Следующий шаг по ответам в data: сначала условные переходы, затем next"""
+        for target, condition in self.branches:
+            if condition(data):
+                return target
+        return self.default_next
+
+    def previous_step(self, data: dict):
+        """Шаг, с которого пользователь пришел сюда при тех же ответах (None для первого вопроса)"""
+        for step in self.conditional_previous:
+            if step.next_step(data) == self.name:
+                return step.name
+        if self.unconditional_previous is None and self.conditional_previous:
+            # Ответа предыдущего шага нет в данных (например, анкета начата до обновления бота)
+            return self.conditional_previous[0].name
+        return self.unconditional_previous
+
+
+def compile_flow(question_flow: dict) -> dict:
+    """{имя шага: Step}; граф проверяется при запуске бота, а не на шаге пользователя"""
+    flow = {name: Step(name, spec) for name, spec in question_flow.items()}
+
+    for step in flow.values():
+        for target in step.targets:
+            if target not in flow:
+                raise ValueError(f"❌ Questionnaire step {step.name} leads to unknown step {target}")
+            incoming = flow[target]
+            if step.branches:
+                # Переход зависит от ответа: при "Назад" проверяется, что он ведет именно сюда
+                if step not in incoming.conditional_previous:
+                    incoming.conditional_previous += (step,)
+            elif incoming.unconditional_previous not in (None, step.name):
+                raise ValueError(
+                    f"❌ Questionnaire step {target} has two unconditional previous steps: "
+                    f"{incoming.unconditional_previous} and {step.name}"
+                )
+            else:
+                incoming.unconditional_previous = step.name
+
+        for target in step.branch_messages:
+            if target not in step.targets:
+                raise ValueError(f"❌ Questionnaire step {step.name} has a message for unknown transition {target}")
+
+    return flow
+
+
+FLOW = compile_flow(QUESTION_FLOW)
+FIRST_STEP = FLOW[next(iter(QUESTION_FLOW))]
+# Ключ — строка состояния FSM ("QuestionnaireStates:Q3_Gender"), как в data["raw_state"]
+FLOW_BY_STATE = {step.state.state: step for step in FLOW.values()}
@@ -3,82 +3,166 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemo
 
 QUESTION_COUNT = 25
 
+REGIONS = [
+    "Андижанская область — Андижан",
+    "Бухарская область — Бухара",
+    "Джизакская область — Джизак",
+    "Кашкадарьинская область — Карши",
+    "Навоийская область — Навоий",
+    "Наманганская область — Наманган",
+    "Самаркандская область — Самарканд",
+    "Сурхандарьинская область — Термез",
+    "Сырдарьинская область — Гулистан",
+    "Ташкентская область — Нурафшан",
+    "Ферганская область — Фергана",
+    "Хорезмская область — Ургенч",
+    "Республика Каракалпакстан — Нукус",
+    "г. Ташкент — Ташкент",
+    "Другое"
+]
+
+
+def answer_is(data_key: str, value: str):
+    """Условие перехода: сохраненный ответ data_key равен value"""
+    return lambda data: data.get(data_key) == value
+
+
+def answer_startswith(data_key: str, prefix: str):
+    """Условие перехода: сохраненный ответ data_key начинается с prefix ("Другое: ...")"""
+    return lambda data: str(data.get(data_key) or "").startswith(prefix)
+
+
+# Граф анкеты. Кроме текста вопроса и вариантов шаг описывает:
+#   data_key     — ключ ответа в данных FSM (очищается при возврате "Назад" с этого шага)
+#   next         — следующий шаг; branches — условные переходы [(шаг, условие(data))], проверяются первыми
+#   initial      — значение data_key при входе на шаг (списки для множественного выбора и файлов)
+#   done_message — сообщение после принятого ответа; error — при неподходящем ответе
+#   branch_messages — {шаг: сообщение} перед переходом на этот шаг
+#   ignore_case  — вариант из options принимается в любом регистре и сохраняется как в options
+#   any_file     — шаг "file" принимает любой документ или фото без проверки формата
+#   numbered     — False для уточняющих шагов без номера "Вопрос N из M"
+# Граф компилируется один раз в robot/utils/question_flow.py
 QUESTION_FLOW = {
     "Q1_FullName": {
         "label": "Введите Ф.И.О. пациента полностью (пример: Ivanov Ivan Ivanovich):",
-        "input_type": "text"
+        "input_type": "text",
+        "data_key": "q1_full_name",
+        "next": "Q2_BirthDate"
     },
     "Q2_BirthDate": {
         "label": "Выберите дату рождения пациента 📅",
         "input_type": "date",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q2_birth_date",
+        "next": "Q3_Gender"
     },
     "Q3_Gender": {
         "label": "Укажите пол пациента:",
         "options": ["Мужской", "Женский"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q3_gender",
+        "next": "Q4_PhoneNumber",
+        "ignore_case": True,
+        "error": "❌ Пожалуйста, выберите один из вариантов: Мужской или Женский."
     },
     "Q4_PhoneNumber": {
         "label": "Пожалуйста, отправьте номер телефона пациента через кнопку ниже:",
         "input_type": "contact",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q4_phone_number",
+        "next": "Q5_TelegramUsername"
     },
     "Q5_TelegramUsername": {
         "label": "Пожалуйста, отправьте ваш Telegram username через кнопку ниже:",
         "input_type": "username",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q5_telegram_username",
+        "next": "Q6_Region"
     },
     "Q6_Region": {
         "label": "📍 Пожалуйста, выберите регион и город проживания из списка ниже или нажмите «Другое» для ручного ввода.",
-        "options": [],
-        "input_type": "text",
-        "back_button": True
+        "options": REGIONS,
+        "input_type": "region",
+        "back_button": True,
+        "data_key": "q6_region",
+        "next": "Q7_WhoApplies",
+        "clear": ["q6_manual_region"],
+        "done_message": "✅ Регион сохранён."
     },
     "Q7_WhoApplies": {
         "label": "Кто обращается?",
         "options": ["Сам(а)", "Родственник"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q7_who_applies",
+        "next": "Q8_SaboPatient"
     },
     "Q8_SaboPatient": {
         "label": "Является ли пациентом Сабо-Дармон?",
         "options": ["Да", "Нет", "Неизвестно"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q8_is_sabodarmon",
+        "next": "Q9_HowFound"
     },
     "Q9_HowFound": {
         "label": "Откуда вы узнали о программе?",
         "options": ["Telegram", "Instagram", "Клиника", "Знакомые", "Другое"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q9_source_info",
+        "next": "Q10_HasDiagnosis"
     },
     "Q10_HasDiagnosis": {
         "label": "Есть ли установленный диагноз?",
         "options": ["✅ Да", "❌ Нет"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q10_has_diagnosis",
+        "next": "Q11_DiagnosisText",
+        "branches": [("Q13_Complaint", answer_is("q10_has_diagnosis", "❌ Нет"))],
+        "branch_messages": {"Q13_Complaint": "📎 Прикрепление файла не требуется."}
     },
     "Q11_DiagnosisText": {
         "label": "Укажите диагноз пациента:",
         "input_type": "text",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q11_diagnosis_text",
+        "next": "Q12_DiagnosisFile"
     },
     "Q12_DiagnosisFile": {
         "label": "Прикрепите фото/скан диагноза или эпикриза.",
-        "input_type": "file_optional",
-        "back_button": True
+        "input_type": "file",
+        "back_button": True,
+        "data_key": "q12_diagnosis_file_id",
+        "next": "Q13_Complaint",
+        "done_message": "✅ Диагноз прикреплён!",
+        "error": "❌ Пожалуйста, прикрепите PDF или изображение (фото диагноза)."
     },
     "Q13_Complaint": {
         "label": "Введите кратко жалобу / причину обращения:",
         "input_type": "text",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q13_complaint",
+        "next": "Q14_MainDiscomfort"
     },
     "Q14_MainDiscomfort": {
         "label": "Что доставляет вам наибольшие неудобства от текущей болезни?",
         "options": ["Боль", "Нарушение сна", "Невозможность работать", "Ограничение в передвижении", "Другое"],
-        "input_type": "buttons_optional_text",
-        "back_button": True
+        "input_type": "buttons",
+        "back_button": True,
+        "data_key": "q14_main_discomfort",
+        "next": "Q15_ImprovementsAfterTreatment",
+        "branches": [("Q14_MainDiscomfortOther", answer_startswith("q14_main_discomfort", "Другое"))]
+    },
+    "Q14_MainDiscomfortOther": {
+        "label": "📝 Уточните, что именно вам мешает:",
+        "input_type": "text",
+        "numbered": False,
+        "data_key": "q14_main_discomfort",
+        "value_format": "Другое: {}",
+        "next": "Q15_ImprovementsAfterTreatment"
     },
     "Q15_ImprovementsAfterTreatment": {
         "label": "Что изменится после лечения?\n\nВыберите всё, что подходит, по одному пункту. Когда закончите — нажмите ✅ Готово.",
@@ -89,7 +173,10 @@ QUESTION_FLOW = {
         ],
         "finish_button": "✅ Готово",
         "input_type": "multi_buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q15_improvements",
+        "next": "Q16_WithoutTreatmentConsequences",
+        "initial": []
     },
     "Q16_WithoutTreatmentConsequences": {
         "label": "Что будет, если не лечиться?\n\nВыберите всё, что подходит, по одному пункту. Когда закончите — нажмите ✅ Завершить выбор.",
@@ -99,82 +186,129 @@ QUESTION_FLOW = {
         ],
         "finish_button": "✅ Завершить выбор",
         "input_type": "multi_buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q16_consequences",
+        "next": "Q17_NeedConfirmationDocs",
+        "initial": [],
+        "done_message": "✅ Спасибо! Переходим к следующим вопросам..."
     },
     "Q17_NeedConfirmationDocs": {
         "label": "📄 Есть ли подтверждение нуждаемости от махалли или других органов?",
         "options": ["☑️ Да, есть", "☑️ Нет, но можем взять", "☑️ Нет"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q17_need_confirmation",
+        "next": "Q18_AvgIncome",
+        "branches": [("Q17_ConfirmationFile", answer_is("q17_need_confirmation", "☑️ Да, есть"))]
     },
     "Q17_ConfirmationFile": {
         "label": "📎 Прикрепите документ: справку о нуждаемости, 'темир дафтар' и т.п. (фото или PDF).",
         "input_type": "file",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q17_confirmation_file",
+        "next": "Q18_AvgIncome",
+        "any_file": True,
+        "done_message": "✅ Документ получен."
     },
     "Q18_AvgIncome": {
         "label": "📊 Укажите средний доход вашей семьи в месяц:",
         "options": ["До 5 млн", "5–7 млн", "7–10 млн", "10+ млн"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q18_avg_income",
+        "next": "Q18_IncomeDoc"
     },
     "Q18_IncomeDoc": {
         "label": "📎 Прикрепите подтверждающий документ (справка о доходах, выписка и т.п.).",
         "input_type": "file",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q18_income_doc",
+        "next": "Q19_ChildrenCount",
+        "any_file": True,
+        "error": "❌ Прикрепите PDF или изображение документа о доходах."
     },
     "Q19_ChildrenCount": {
         "label": "👶 Сколько несовершеннолетних детей в семье?",
         "options": ["0", "1", "2", "3", "4", "5+"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q19_children_count",
+        "next": "Q19_ChildrenDocs",
+        "branches": [("Q21_FamilyWork", answer_is("q19_children_count", "0"))]
     },
     "Q19_ChildrenDocs": {
         "label": "📎 Прикрепите метрику каждого ребёнка (фото или PDF). После загрузки всех файлов нажмите «✅ Завершить загрузку».",
         "input_type": "file_multiple",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q19_children_docs",
+        "next": "Q21_FamilyWork",
+        "initial": [],
+        "finish_button": "✅ Завершить загрузку"
     },
     "Q21_FamilyWork": {
         "label": "👨‍💼 Кто работает в семье?",
         "options": ["☑️ Только муж", "☑️ Оба", "☑️ Никто", "☑️ Только жена", "☑️ Пенсионер"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q21_family_work",
+        "next": "Q22_HousingType"
     },
     "Q22_HousingType": {
         "label": "🏠 Какой у вас тип жилья?",
         "options": ["☑️ Собственное", "☑️ Аренда", "☑️ У родственников"],
         "input_type": "buttons",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q22_housing_type",
+        "next": "Q23_DiagnosisConfirm",
+        "branches": [("Q22_HousingDoc", answer_is("q22_housing_type", "☑️ Аренда"))]
     },
     "Q22_HousingDoc": {
         "label": "📎 Прикрепите договор аренды или иной подтверждающий документ, зарегистрированный в налоговой (например, свидетельство, уведомление или справка).",
         "input_type": "file",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q22_housing_doc",
+        "next": "Q23_DiagnosisConfirm",
+        "done_message": "✅ Документ по жилью получен.",
+        "error": "❌ Прикрепите изображение или PDF договора аренды."
     },
     "Q23_DiagnosisConfirm": {
         "label": "📝 Выберите диагноз, нажав на кнопку с номером.",
-        "input_type": "buttons",
-        "back_button": True
+        "input_type": "diagnosis",
+        "back_button": True,
+        "data_key": "q23_diagnosis_confirm",
+        "next": "Q24_AdditionalFile"
     },
     "Q24_AdditionalFile": {
         "label": "📎 Прикрепите дополнительный файл, подтверждающий ваши обстоятельства (необязательно).\nЕсли хотите пропустить — отправьте точку (.) или любой символ.",
         "input_type": "file_optional",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q24_additional_file",
+        "next": "Q25_FinalComment",
+        "error": "❌ Прикрепите изображение или PDF-документ."
     },
     "Q25_FinalComment": {
         "label": "📝 Есть ли у вас другие важные обстоятельства, которые помогут Клинике Сабо Дормон принять правильное решение по вашему делу?",
         "input_type": "text",
-        "back_button": True
+        "back_button": True,
+        "data_key": "q25_final_comment",
+        "next": None
     }
 }
 
 
+# Номера вопросов считаются один раз; уточняющие шаги (numbered=False) не нумеруются
+QUESTION_NUMBERS = {
+    name: number
+    for number, name in enumerate((name for name, spec in QUESTION_FLOW.items() if spec.get("numbered", True)), 1)
+}
+
+
 def get_question_label(state_name: str) -> str:
-    question_keys = list(QUESTION_FLOW.keys())
-    index = question_keys.index(state_name) + 1
-    total = len(question_keys)
     label = QUESTION_FLOW[state_name]["label"]
-    return f"🔹 Вопрос {index} из {total}:\n{label}"
+    number = QUESTION_NUMBERS.get(state_name)
+    if number is None:
+        return label
+    return f"🔹 Вопрос {number} из {len(QUESTION_NUMBERS)}:\n{label}"
 
 def get_keyboard_for(state_name: str) -> ReplyKeyboardMarkup | None:
     options = QUESTION_FLOW[state_name].get("options")
@@ -0,0 +1,155 @@
+import asyncio
+import contextlib
+import secrets
+import signal
+from typing import List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from django.conf import settings
+from pydantic import ValidationError
+
+from robot.utils.misc.logging import logger
+
+
+def get_update_key(update: Update) -> int:
+    """Ключ апдейта для шардинга: id пользователя, иначе id чата, иначе id апдейта"""
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return chat.id
+
+    return update.update_id
+
+
+class UpdateWorkerPool:
+    """Ограниченные очереди апдейтов и N воркеров.
+
+    Апдейты одного пользователя всегда попадают в одну и ту же очередь,
+    поэтому обрабатываются строго по порядку, а разные пользователи
+    обслуживаются параллельно.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int, queue_size: int):
+        if workers < 1:
+            raise ValueError("❌ workers must be >= 1")
+        self.dp = dp
+        self.bot = bot
+        self.queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._tasks: List[asyncio.Task] = []
+        self.dropped = 0
+
+    def submit(self, update: Update) -> bool:
+        """Кладет апдейт в очередь без ожидания; False если очередь переполнена"""
+        queue = self.queues[get_update_key(update) % len(self.queues)]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Update queue is full, update {update.update_id} rejected (dropped: {self.dropped})")
+            return False
+        return True
+
+    async def _worker(self, index: int, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Worker {index} failed to process update {update.update_id}: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._worker(index, queue), name=f"update-worker-{index}")
+            for index, queue in enumerate(self.queues)
+        ]
+
+    async def stop(self, timeout: float = 30):
+        """Дожидается обработки уже принятых апдейтов и останавливает воркеров"""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Update queues were not drained before shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def create_webhook_app(pool: UpdateWorkerPool, path: str, secret: Optional[str] = None) -> web.Application:
+    """aiohttp-приложение, которое только принимает апдейты и сразу отвечает Telegram"""
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and not secrets.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret
+        ):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": pool.bot})
+        except (ValueError, ValidationError) as e:
+            # Повтор того же тела не поможет, поэтому 400, а не 5xx
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return web.Response(status=400)
+        if not pool.submit(update):
+            # Telegram повторит доставку позже
+            return web.Response(status=503)
+        return web.Response(status=200)
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, host: str, port: int, workers: int, queue_size: int):
+    """Запускает webhook-сервер и пул воркеров до SIGTERM/SIGINT.
+
+    Telegram не повторяет апдейты, на которые получил 200, поэтому при остановке
+    сервер сначала перестает принимать запросы, а затем пул дорабатывает очереди.
+    """
+    pool = UpdateWorkerPool(dp, bot, workers=workers, queue_size=queue_size)
+    app = create_webhook_app(pool, settings.WEBHOOK_PATH, settings.WEBHOOK_SECRET or None)
+
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        # На Windows обработчики сигналов в event loop не поддерживаются
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(signum, stop_event.set)
+
+    await dp.emit_startup(bot=bot)
+    pool.start()
+
+    runner = web.AppRunner(app)
+    try:
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+
+        await bot.set_webhook(
+            url=f"{settings.WEBHOOK_BASE_URL.rstrip('/')}{settings.WEBHOOK_PATH}",
+            secret_token=settings.WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"Webhook server started on {host}:{port} with {workers} workers")
+
+        await stop_event.wait()
+        logger.info("Webhook server stopping: draining accepted updates")
+    finally:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            with contextlib.suppress(NotImplementedError):
+                loop.remove_signal_handler(signum)
+        await runner.cleanup()
+        await pool.stop()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
@@ -1,20 +1,116 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from ..models import Patient
-from ..serializers import PatientSerializer
+from ..models import Patient, REVIEWER_ROLES
+from ..serializers import PatientSerializer, PatientListSerializer, BulkDecisionSerializer, PATIENT_LIST_FIELDS
+from ..pagination import KeysetPagination, UpdatedSincePagination
+from ..services.patient_stats import get_patient_stats
 import logging
 
 logger = logging.getLogger(__name__)
 
-class PatientListView(generics.ListAPIView):
-    queryset = Patient.objects.all().order_by('-created_at')
-    serializer_class = PatientSerializer
+class PatientRowsMixin:
+    """Списки пациентов читаются через QuerySet.values() и PatientListSerializer.
+
+    ?fields=id,full_name,status — только перечисленные поля из PATIENT_LIST_FIELDS;
+    столбцы, не попавшие в ответ, не выбираются из БД (кроме ключа курсора).
+    """
+    serializer_class = PatientListSerializer
+    fields_query_param = "fields"
+
+    def get_list_fields(self) -> list:
+        raw = self.request.query_params.get(self.fields_query_param, "")
+        fields = [name for name in raw.split(",") if name]
+        if not fields:
+            return list(PATIENT_LIST_FIELDS)
+        unknown = set(fields) - set(PATIENT_LIST_FIELDS)
+        if unknown:
+            raise ValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}"})
+        return ["id", *[name for name in fields if name != "id"]]
+
+    def get_queryset(self):
+        self.list_fields = self.get_list_fields()
+        columns = [*self.list_fields]
+        if self.paginator.ordering_field not in columns:
+            columns.append(self.paginator.ordering_field)
+        return super().get_queryset().values(*columns)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", getattr(self, "list_fields", None))
+        return super().get_serializer(*args, **kwargs)
+
+
+class PatientListView(PatientRowsMixin, generics.ListAPIView):
+    """Список пациентов постранично (?cursor=&page_size=) с фильтрами:
+    ?status=waiting,rejected — по статусам через запятую;
+    ?queue=doctor|accountant|mine — анкеты, ожидающие решения проверяющего;
+    ?search= — по ФИО, телефону или ID пациента.
+    """
+    queryset = Patient.objects.all()
+    pagination_class = KeysetPagination
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+
+        statuses = [value for value in params.get("status", "").split(",") if value]
+        if statuses:
+            valid_statuses = {value for value, _ in Patient.STATUS_CHOICES}
+            unknown = set(statuses) - valid_statuses
+            if unknown:
+                raise ValidationError({"status": f"Unknown status: {', '.join(sorted(unknown))}"})
+            queryset = queryset.filter(status__in=statuses)
+
+        queue = params.get("queue")
+        if queue == "mine":
+            queue = self.request.auth.get("role")
+            if queue not in REVIEWER_ROLES:
+                raise ValidationError({"queue": "Queue 'mine' requires a doctor or accountant token"})
+        if queue:
+            if queue not in REVIEWER_ROLES:
+                raise ValidationError({"queue": f"Unknown queue: {queue}"})
+            # Ждут решения этого проверяющего: он еще не ответил и анкета не отклонена
+            queryset = queryset.filter(is_rejected=False, **{f"approved_by_{queue}": False, f"rejected_by_{queue}": False})
+
+        search = params.get("search", "").strip()
+        if search:
+            queryset = queryset.filter(
+                Q(full_name__icontains=search)
+                | Q(phone_number__icontains=search)
+                | Q(patient_id__icontains=search)
+            )
+
+        return queryset
+
+
+class PatientChangesView(PatientRowsMixin, generics.ListAPIView):
+    """Пациенты, измененные или добавленные после курсора (?updated_since= или ?cursor=).
+
+    Панель загружает список один раз, а затем запрашивает только изменения,
+    передавая next_cursor из предыдущего ответа.
+    """
+    queryset = Patient.objects.all()
+    pagination_class = UpdatedSincePagination
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+
+class PatientStatsView(APIView):
+    """Счетчики для панели управления; кешируются на PATIENT_STATS_CACHE_TTL секунд
+    и сбрасываются при изменении статуса пациента"""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(get_patient_stats(), status=200)
+
 
 class ApprovePatientView(APIView):
     authentication_classes = [JWTAuthentication]
@@ -24,31 +120,19 @@ class ApprovePatientView(APIView):
         token_payload = request.auth
         role = token_payload.get("role")
 
-        patient = get_object_or_404(Patient, pk=pk)
-        comment = request.data.get("comment", "")
-        
-        # Сохраняем предыдущий статус для логирования
-        previous_status = patient.status
-
-        if role == "doctor":
-            patient.approved_by_doctor = True
-            patient.rejected_by_doctor = False
-            patient.doctor_comment = comment
-            logger.info(f"Врач одобрил пациента {patient.patient_id}")
-            
-        elif role == "accountant":
-            patient.approved_by_accountant = True
-            patient.rejected_by_accountant = False
-            patient.accountant_comment = comment
-            logger.info(f"Бухгалтер одобрил пациента {patient.patient_id}")
-        else:
+        if role not in REVIEWER_ROLES:
             return Response({"error": "⛔ У вас нет прав для одобрения"}, status=403)
 
-        # Сохраняем пациента (сигнал автоматически отправит уведомление)
-        patient.save()
-        patient.check_full_approval()
-        
-        logger.info(f"Статус пациента {patient.patient_id} изменен: {previous_status} -> {patient.status}")
+        comment = request.data.get("comment", "")
+
+        # Решение применяется одним UPDATE под блокировкой строки, уведомление ставится в очередь сигналом
+        changes = Patient.objects.filter(pk=pk).apply_decision(role, approve=True, comment=comment)
+        if not changes:
+            raise Http404
+        patient, previous_status, new_status = changes[0]
+
+        logger.info(f"{'Врач' if role == 'doctor' else 'Бухгалтер'} одобрил пациента {patient.patient_id}")
+        logger.info(f"Статус пациента {patient.patient_id} изменен: {previous_status} -> {new_status}")
         
         return Response(PatientSerializer(patient).data, status=200)
 
@@ -61,27 +145,61 @@ class RejectPatientView(APIView):
         token_payload = request.auth
         role = token_payload.get("role")
 
-        if role not in ["doctor", "accountant"]:
+        if role not in REVIEWER_ROLES:
             return Response({"error": "⛔ У вас нет прав для отклонения"}, status=403)
 
-        patient = get_object_or_404(Patient, pk=pk)
         comment = request.data.get("comment", "")
-        
-        # Сохраняем предыдущий статус для логирования
-        previous_status = patient.status
 
-        if role == "doctor":
-            patient.reject(by="doctor", comment=comment)
-            logger.info(f"Врач отклонил пациента {patient.patient_id}. Комментарий: {comment}")
-        elif role == "accountant":
-            patient.reject(by="accountant", comment=comment)
-            logger.info(f"Бухгалтер отклонил пациента {patient.patient_id}. Комментарий: {comment}")
+        changes = Patient.objects.filter(pk=pk).apply_decision(role, approve=False, comment=comment)
+        if not changes:
+            raise Http404
+        patient, previous_status, new_status = changes[0]
 
-        logger.info(f"Статус пациента {patient.patient_id} изменен: {previous_status} -> {patient.status}")
+        logger.info(f"{'Врач' if role == 'doctor' else 'Бухгалтер'} отклонил пациента {patient.patient_id}. Комментарий: {comment}")
+        logger.info(f"Статус пациента {patient.patient_id} изменен: {previous_status} -> {new_status}")
         
         return Response(PatientSerializer(patient).data, status=status.HTTP_200_OK)
 
 
+class BulkDecisionView(APIView):
+    """Одобрение или отклонение нескольких анкет за один запрос.
+
+    Тело: {"ids": [1, 2, 3], "decision": "approve" | "reject", "comment": ""}.
+    Решение применяется в одной транзакции одним UPDATE, уведомления ставятся
+    в очередь одним INSERT. В ответе — результат по каждому ID.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        role = request.auth.get("role")
+        if role not in REVIEWER_ROLES:
+            return Response({"error": "⛔ У вас нет прав для принятия решения"}, status=403)
+
+        serializer = BulkDecisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data["ids"]))
+        approve = serializer.validated_data["decision"] == "approve"
+        comment = serializer.validated_data["comment"]
+
+        changes = Patient.objects.filter(pk__in=ids).apply_decision(role, approve=approve, comment=comment)
+        changed = {patient.pk: (previous_status, new_status) for patient, previous_status, new_status in changes}
+
+        results = []
+        for pk in ids:
+            if pk not in changed:
+                results.append({"id": pk, "ok": False, "error": "not_found"})
+                continue
+            previous_status, new_status = changed[pk]
+            results.append({"id": pk, "ok": True, "previous_status": previous_status, "status": new_status})
+
+        logger.info(
+            f"{'Врач' if role == 'doctor' else 'Бухгалтер'} {'одобрил' if approve else 'отклонил'} "
+            f"пациентов: {len(changes)} из {len(ids)}"
+        )
+        return Response({"updated": len(changes), "results": results}, status=200)
+
+
 class SendNotificationView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]